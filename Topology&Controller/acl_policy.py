@@ -0,0 +1,494 @@
+# Static firewall policy compiled into OpenFlow rules.
+#
+# The policy file is a JSON document with an ordered list of rules, the first
+# matching rule deciding (as in iptables), and a default action:
+#
+#   {"default": "allow",
+#    "rules": [
+#      {"action": "allow", "ipv4_src": "10.0.0.4", "proto": "tcp", "dst_port": 22},
+#      {"action": "deny", "switches": ["s1", 2], "ipv4_src": "10.0.0.0/24", "proto": "tcp", "dst_port": 22},
+#      {"action": "deny", "eth_src": "00:00:00:00:00:01", "ipv4_dst": "10.0.0.3"}]}
+#
+# Match fields: in_port, eth_src, eth_dst, ipv4_src, ipv4_dst (address or
+# prefix), proto ('tcp', 'udp', 'icmp' or a number), src_port and dst_port
+# (tcp or udp only). A missing field matches anything; "switches" (names of
+# the link bandwidth file or dpids) restricts a rule to some switches.
+#
+# The rules of every switch are compiled into the fewest entries:
+#   - rules shadowed by an earlier rule are removed;
+#   - within a run of consecutive rules with the same action (which can be
+#     reordered freely), rules covered by another one are removed and
+#     sibling prefixes are merged into their parent prefix;
+#   - rules that do not change the outcome (allow rules, or deny rules
+#     covered by a later deny, that no later rule of the other action
+#     intersects) are removed;
+#   - priorities are the layers of the "must beat" relation: a rule is
+#     only placed above the later rules of the other action it intersects,
+#     so that rules which do not conflict share a priority.
+# Deny entries drop the traffic; allow entries (only kept as exceptions to a
+# later deny) hand the traffic back to the forwarding of the app. Overlap
+# tests go through an index of the rules by IPv4 prefix, so the compilation
+# does not compare every pair of rules.
+#
+# Entries are installed as diffs against the entries already on the switch
+# (AclPolicy.diff), so a policy change only adds and deletes what changed.
+# The compilation runs on a thread of its own, a large policy taking
+# seconds: a switch keeps its entries until the new ones are compiled.
+
+import collections
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+
+ALLOW = 'allow'
+DENY = 'deny'
+ACTIONS = (ALLOW, DENY)
+
+IPPROTO = {'icmp': 1, 'tcp': 6, 'udp': 17}
+_L4_FIELDS = {6: ('tcp_src', 'tcp_dst'), 17: ('udp_src', 'udp_dst')}
+ETH_TYPE_IP = 0x0800
+
+# Fields of a match tuple; ipv4_src and ipv4_dst are (network, length)
+# prefixes, (0, 0) matching anything, the others exact values or None
+FIELDS = ('in_port', 'eth_src', 'eth_dst', 'ipv4_src', 'ipv4_dst', 'ip_proto', 'src_port', 'dst_port')
+IPV4_SRC = FIELDS.index('ipv4_src')
+IPV4_DST = FIELDS.index('ipv4_dst')
+_EXACT = tuple(i for i in range(len(FIELDS)) if i not in (IPV4_SRC, IPV4_DST))
+ANY_PREFIX = (0, 0)
+
+_MASKS = [(0xffffffff << (32 - length)) & 0xffffffff for length in range(33)]
+
+
+def parse_prefix(text):
+    address, _, length = text.partition('/')
+    length = int(length) if length else 32
+    if not 0 <= length <= 32:
+        raise ValueError('invalid prefix length in %s' % text)
+    return struct.unpack('!I', socket.inet_aton(address))[0] & _MASKS[length], length
+
+
+def format_prefix(prefix):
+    network, length = prefix
+    address = socket.inet_ntoa(struct.pack('!I', network))
+    if length == 32:
+        return address
+    return address, socket.inet_ntoa(struct.pack('!I', _MASKS[length]))
+
+
+def covers(a, b):
+    # Every packet matching b matches a
+    for i in _EXACT:
+        if a[i] is not None and a[i] != b[i]:
+            return False
+    for i in (IPV4_SRC, IPV4_DST):
+        (net_a, len_a), (net_b, len_b) = a[i], b[i]
+        if len_a > len_b or net_b & _MASKS[len_a] != net_a:
+            return False
+    return True
+
+
+def intersects(a, b):
+    # Some packet matches both a and b
+    for i in _EXACT:
+        if a[i] is not None and b[i] is not None and a[i] != b[i]:
+            return False
+    for i in (IPV4_SRC, IPV4_DST):
+        (net_a, len_a), (net_b, len_b) = a[i], b[i]
+        length = min(len_a, len_b)
+        if net_a & _MASKS[length] != net_b & _MASKS[length]:
+            return False
+    return True
+
+
+class Rule(object):
+    __slots__ = ('action', 'match', 'switches')
+
+    def __init__(self, action, match, switches=None):
+        self.action = action
+        self.match = match
+        self.switches = switches  # frozenset of dpids, None for every switch
+
+
+def parse_rule(entry, names=None):
+    # Rule of one entry of the policy file; names maps switch names to dpids
+    action = entry.get('action')
+    if action not in ACTIONS:
+        raise ValueError('invalid action %r' % action)
+    proto = entry.get('proto')
+    if proto is not None:
+        proto = IPPROTO[proto] if proto in IPPROTO else int(proto)
+    src_port, dst_port = entry.get('src_port'), entry.get('dst_port')
+    if (src_port is not None or dst_port is not None) and proto not in _L4_FIELDS:
+        raise ValueError('ports need proto tcp or udp')
+    match = (entry.get('in_port'),
+             entry['eth_src'].lower() if entry.get('eth_src') else None,
+             entry['eth_dst'].lower() if entry.get('eth_dst') else None,
+             parse_prefix(entry['ipv4_src']) if entry.get('ipv4_src') else ANY_PREFIX,
+             parse_prefix(entry['ipv4_dst']) if entry.get('ipv4_dst') else ANY_PREFIX,
+             proto, src_port, dst_port)
+    switches = None
+    if entry.get('switches') is not None:
+        switches = frozenset(switch if isinstance(switch, int) else (names or {})[switch]
+                             for switch in entry['switches'])
+    return Rule(action, match, switches)
+
+
+class PrefixIndex(object):
+    # Rules indexed by one of their prefixes (field `field` of the match):
+    # the rules whose prefix contains, or is contained in, a given prefix
+    # are found with at most 33 dict lookups each
+
+    def __init__(self, field):
+        self.field = field
+        self.exact = collections.defaultdict(list)  # prefix -> rules
+        self.below = collections.defaultdict(list)  # (length, network) -> rules with a longer prefix inside
+
+    def add(self, rule):
+        network, length = rule.match[self.field]
+        self.exact[(network, length)].append(rule)
+        for shorter in range(length):
+            self.below[(shorter, network & _MASKS[shorter])].append(rule)
+
+    def containing(self, match):
+        # Rules whose prefix contains the prefix of match (equal included)
+        network, length = match[self.field]
+        exact = self.exact
+        for shorter in range(length + 1):
+            rules = exact.get((network & _MASKS[shorter], shorter))
+            if rules:
+                for rule in rules:
+                    yield rule
+
+    def overlapping(self, match):
+        # Rules whose prefix intersects the prefix of match
+        for rule in self.containing(match):
+            yield rule
+        network, length = match[self.field]
+        rules = self.below.get((length, network))
+        if rules:
+            for rule in rules:
+                yield rule
+
+
+def _index_field(rules):
+    # Index on the prefix field telling the rules apart best
+    src = len(set(rule.match[IPV4_SRC] for rule in rules))
+    dst = len(set(rule.match[IPV4_DST] for rule in rules))
+    return IPV4_SRC if src >= dst else IPV4_DST
+
+
+def remove_shadowed(rules):
+    # Drop the rules covered by an earlier rule: they never match first
+    index = PrefixIndex(_index_field(rules))
+    kept = []
+    for rule in rules:
+        if any(covers(earlier.match, rule.match) for earlier in index.containing(rule.match)):
+            continue
+        index.add(rule)
+        kept.append(rule)
+    return kept
+
+
+def aggregate(prefixes):
+    # Smallest set of prefixes covering exactly the same addresses
+    prefixes = set(prefixes)
+    for length in range(32, 0, -1):
+        bit = 1 << (32 - length)
+        for network, prefix_len in [prefix for prefix in prefixes if prefix[1] == length]:
+            sibling = (network ^ bit, length)
+            if (network, length) in prefixes and sibling in prefixes:
+                prefixes.discard((network, length))
+                prefixes.discard(sibling)
+                prefixes.add((network & ~bit & 0xffffffff, length - 1))
+    # Prefixes inside another one
+    result = []
+    for prefix in sorted(prefixes, key=lambda prefix: prefix[1]):
+        if not any(prefix[0] & _MASKS[length] == network for network, length in result if length <= prefix[1]):
+            result.append(prefix)
+    return result
+
+
+def merge_run(run):
+    # Rules of the same action can be reordered: aggregate the prefixes of
+    # the rules equal in all the other fields, first on ipv4_src then on
+    # ipv4_dst. A merged rule takes the place of the first of its rules.
+    for field in (IPV4_SRC, IPV4_DST):
+        groups = collections.OrderedDict()
+        for position, rule in enumerate(run):
+            key = rule.match[:field] + rule.match[field + 1:]
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = (position, rule, [])
+            group[2].append(rule.match[field])
+        merged = []
+        for key, (position, first, prefixes) in groups.items():
+            if len(prefixes) == 1:
+                merged.append((position, first))
+                continue
+            for prefix in aggregate(prefixes):
+                merged.append((position, Rule(first.action, key[:field] + (prefix,) + key[field:],
+                                              first.switches)))
+        run = [rule for _, rule in sorted(merged, key=lambda item: item[0])]
+    return run
+
+
+def compile_rules(rules, default=ALLOW):
+    # Entries [(priority level, match, action)] implementing the ordered
+    # rules; level 0 is the lowest priority
+    if default == DENY:
+        rules = list(rules) + [Rule(DENY, (None, None, None, ANY_PREFIX, ANY_PREFIX, None, None, None))]
+    rules = remove_shadowed(rules)
+
+    runs = []
+    for rule in rules:
+        if runs and runs[-1][0].action == rule.action:
+            runs[-1].append(rule)
+        else:
+            runs.append([rule])
+    rules = remove_shadowed([rule for run in runs for rule in merge_run(remove_shadowed(run))])
+
+    # From the last rule up: keep the rules that change the outcome and give
+    # each one a level above the later rules of the other action it intersects
+    if not rules:
+        return []
+    field = _index_field(rules)
+    indexes = {ALLOW: PrefixIndex(field), DENY: PrefixIndex(field)}
+    levels = {}
+    entries = []
+    for rule in reversed(rules):
+        other = DENY if rule.action == ALLOW else ALLOW
+        level = -1
+        for later in indexes[other].overlapping(rule.match):
+            if intersects(later.match, rule.match):
+                level = max(level, levels[id(later)] + 1)
+        if level < 0:
+            # Nothing of the other action below it: the rule only matters if
+            # the traffic would otherwise be allowed
+            if rule.action == ALLOW or any(covers(later.match, rule.match)
+                                           for later in indexes[rule.action].containing(rule.match)):
+                continue
+            level = 0
+        levels[id(rule)] = level
+        indexes[rule.action].add(rule)
+        entries.append((level, rule.match, rule.action))
+    entries.reverse()
+    return entries
+
+
+def to_fields(match):
+    # OFPMatch keyword arguments of a match tuple
+    in_port, eth_src, eth_dst, ipv4_src, ipv4_dst, ip_proto, src_port, dst_port = match
+    fields = {}
+    if in_port is not None:
+        fields['in_port'] = in_port
+    if eth_src is not None:
+        fields['eth_src'] = eth_src
+    if eth_dst is not None:
+        fields['eth_dst'] = eth_dst
+    if ipv4_src != ANY_PREFIX or ipv4_dst != ANY_PREFIX or ip_proto is not None:
+        fields['eth_type'] = ETH_TYPE_IP
+        if ipv4_src != ANY_PREFIX:
+            fields['ipv4_src'] = format_prefix(ipv4_src)
+        if ipv4_dst != ANY_PREFIX:
+            fields['ipv4_dst'] = format_prefix(ipv4_dst)
+        if ip_proto is not None:
+            fields['ip_proto'] = ip_proto
+            if src_port is not None:
+                fields[_L4_FIELDS[ip_proto][0]] = src_port
+            if dst_port is not None:
+                fields[_L4_FIELDS[ip_proto][1]] = dst_port
+    return fields
+
+
+def from_fields(fields):
+    # Match tuple of the fields of an entry read back from a switch
+    def prefix(value):
+        if value is None:
+            return ANY_PREFIX
+        if isinstance(value, (tuple, list)):
+            address, mask = value
+            return parse_prefix('%s/%d' % (address, bin(parse_prefix(mask)[0]).count('1')))
+        return parse_prefix(value)
+
+    ip_proto = fields.get('ip_proto')
+    src_field, dst_field = _L4_FIELDS.get(ip_proto, (None, None))
+    return (fields.get('in_port'), fields.get('eth_src'), fields.get('eth_dst'),
+            prefix(fields.get('ipv4_src')), prefix(fields.get('ipv4_dst')), ip_proto,
+            fields.get(src_field), fields.get(dst_field))
+
+
+class AclPolicy(object):
+    # Policy file, its compiled entries per switch and the entries installed
+    # on every switch ({match: (priority, action)}). Entries take the
+    # priorities from base_priority up to max_priority. The file is
+    # reloaded when its modification time changes.
+    #
+    # With threaded True the rules are compiled by an OS thread, which only
+    # reads the rules it is given: its results are stored by poll, called on
+    # the event loop, all the switches of a policy change going over to the
+    # new entries at once. Until then entries returns None for a switch. With
+    # threaded False the rules are compiled when needed (benchmarks).
+
+    def __init__(self, path, base_priority=2, max_priority=99, check_interval=5, threaded=True, logger=None):
+        self.path = path
+        self.base_priority = base_priority
+        self.max_priority = max_priority
+        self.check_interval = check_interval
+        self.threaded = threaded
+        self.logger = logger
+        self.default = ALLOW
+        self.rules = []
+        self.generation = 0  # of the rules, stale compilations are dropped
+        self.compiled = {}  # applicable rule positions -> entries (None: not installable)
+        self.compiling = set()  # positions sent to the thread
+        self.jobs = queue.Queue()  # (generation, rules, default, [positions]) to compile
+        self.results = collections.deque()  # (generation, [(positions, compiled)]) to store
+        self.thread = None
+        self.installed = {}  # dpid -> {match: (priority, action)}
+        self.mtime = None
+        self.last_check = None
+        self.error = None
+
+    def load(self, names=None):
+        # (Re)load the policy; returns True if it changed
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            self._error('Could not load the firewall policy: %s' % e)
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            with open(self.path) as f:
+                policy = json.load(f)
+            default = policy.get('default', ALLOW)
+            if default not in ACTIONS:
+                raise ValueError('invalid default action %r' % default)
+            rules = [parse_rule(entry, names) for entry in policy.get('rules', [])]
+        except (ValueError, KeyError, TypeError, AttributeError, OSError) as e:
+            # Keep the current policy
+            self._error('Invalid firewall policy %s: %s' % (self.path, e))
+            return False
+        self.error = None
+        self.default = default
+        self.rules = rules
+        self.generation += 1
+        self.compiled = {}
+        self.compiling = set()
+        if self.logger is not None:
+            self.logger.info('Loaded %d firewall rules from %s', len(rules), self.path)
+        # Switches connected or named in the policy
+        dpids = set(self.installed) | set((names or {}).values())
+        self.compile([self.positions(dpid) for dpid in dpids])
+        return True
+
+    def _error(self, message):
+        if message != self.error and self.logger is not None:
+            self.logger.error(message)
+        self.error = message
+
+    def refresh(self, now, names=None):
+        if self.last_check is not None and now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+        return self.load(names)
+
+    def positions(self, dpid):
+        # Positions of the rules applying to the switch; switches sharing the
+        # same rules share the compilation
+        return tuple(i for i, rule in enumerate(self.rules) if rule.switches is None or dpid in rule.switches)
+
+    def prepare(self, dpid):
+        # Compile the entries of a connecting switch while its flow table is read
+        self.compile([self.positions(dpid)])
+
+    def compile(self, todo):
+        todo = [positions for positions in set(todo)
+                if positions not in self.compiled and positions not in self.compiling]
+        if not todo:
+            return
+        job = (self.generation, self.rules, self.default, todo)
+        if not self.threaded:
+            self._store(*self._compile(*job))
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='acl-compiler')
+            self.thread.daemon = True
+            self.thread.start()
+        self.compiling.update(todo)
+        self.jobs.put(job)
+
+    def _compile(self, generation, rules, default, todo):
+        return generation, [(positions, compile_rules([rules[i] for i in positions], default))
+                            for positions in todo]
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                result = self._compile(*job)
+            except Exception:
+                if self.logger is not None:
+                    self.logger.exception('Compilation of the firewall policy failed')
+                result = (job[0], [(positions, None) for positions in job[3]])
+            self.results.append(result)
+
+    def poll(self):
+        # Store the compilations finished by the thread; returns True if any
+        # entries changed
+        changed = False
+        while self.results:
+            changed = self._store(*self.results.popleft()) or changed
+        return changed
+
+    def _store(self, generation, results):
+        if generation != self.generation:
+            # Compiled from rules replaced since
+            return False
+        for positions, compiled in results:
+            self.compiling.discard(positions)
+            entries = None
+            if compiled is not None:
+                levels = max([level for level, _, _ in compiled] or [0]) + 1
+                if self.base_priority + levels - 1 > self.max_priority:
+                    self._error('Firewall policy needs %d priorities, only %d are available: not installed'
+                                % (levels, self.max_priority - self.base_priority + 1))
+                else:
+                    entries = dict((match, (self.base_priority + level, action))
+                                   for level, match, action in compiled)
+            self.compiled[positions] = entries
+        return True
+
+    def entries(self, dpid):
+        # {match: (priority, action)} of the switch, None while it is being
+        # compiled or if it cannot be installed
+        positions = self.positions(dpid)
+        if positions not in self.compiled:
+            self.compile([positions])
+        return self.compiled.get(positions)
+
+    def sync(self, dpid, entries):
+        # Entries found on the switch: [(match fields, priority, action)]
+        self.installed[dpid] = dict((from_fields(fields), (priority, action))
+                                    for fields, priority, action in entries)
+
+    def diff(self, dpid):
+        # (adds, deletes) bringing the switch to the policy and recorded as
+        # installed: adds [(match, priority, action)], deletes [(match, priority)]
+        desired = self.entries(dpid)
+        if desired is None:
+            return [], []
+        installed = self.installed.get(dpid, {})
+        adds = [(match, priority, action) for match, (priority, action) in desired.items()
+                if installed.get(match) != (priority, action)]
+        deletes = [(match, installed[match][0]) for match in installed
+                   if match not in desired or desired[match][0] != installed[match][0]]
+        self.installed[dpid] = dict(desired)
+        return adds, deletes
+
+    def forget_datapath(self, dpid):
+        self.installed.pop(dpid, None)
@@ -0,0 +1,96 @@
+# Benchmark of the firewall policy compiler (acl_policy.py).
+#
+# Builds a synthetic policy in the style of a campus ACL, written in
+# sections: blocked services per subnet, denied subnets with a few allowed
+# hosts, deny lists of single hosts (many of them in adjacent address
+# blocks), blocked MAC addresses, with duplicated or shadowed entries. Reports
+# the compile time, the number of rules, entries and priorities, and the size
+# and time of the diff applied after changing 1% of the rules.
+#
+# Usage: python bench_acl.py [number_of_rules]
+
+import random
+import sys
+import time
+
+import acl_policy
+
+
+def build_policy(count, seed=1):
+    rng = random.Random(seed)
+    sections = ([], [], [], [])
+    total = 0
+    while total < count:
+        kind = rng.random()
+        subnet = '10.%d.%d' % (rng.randrange(16), rng.randrange(256))
+        if kind < 0.2:
+            sections[0].append({'action': 'deny', 'ipv4_dst': '%s.0/24' % subnet,
+                                'proto': rng.choice(('tcp', 'udp')), 'dst_port': rng.choice((22, 23, 445, 3389))})
+        elif kind < 0.35:
+            # A denied subnet except a few hosts
+            for _ in range(rng.randrange(1, 4)):
+                sections[1].append({'action': 'allow', 'ipv4_src': '%s.%d' % (subnet, rng.randrange(256))})
+            sections[1].append({'action': 'deny', 'ipv4_src': '%s.0/24' % subnet})
+        elif kind < 0.85:
+            # A block of consecutive denied hosts
+            start = rng.randrange(0, 256, 16)
+            for host in range(start, start + rng.choice((4, 8, 16))):
+                sections[2].append({'action': 'deny', 'ipv4_src': '%s.%d' % (subnet, host)})
+        elif kind < 0.95:
+            sections[3].append({'action': 'deny', 'eth_src': '02:00:00:%02x:%02x:%02x' % (
+                rng.randrange(256), rng.randrange(256), rng.randrange(256))})
+        else:
+            # Entry repeated further down its section
+            section = rng.choice([section for section in sections if section] or [sections[2]])
+            if section:
+                section.append(dict(rng.choice(section)))
+        total = sum(len(section) for section in sections)
+    rules = [rule for section in sections for rule in section]
+    return {'default': 'allow', 'rules': rules[:count]}
+
+
+def compile_policy(policy):
+    rules = [acl_policy.parse_rule(entry) for entry in policy['rules']]
+    start = time.perf_counter()
+    entries = acl_policy.compile_rules(rules, policy['default'])
+    return entries, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    policy = build_policy(count)
+    entries, elapsed = compile_policy(policy)
+    levels = max([level for level, _, _ in entries] or [0]) + 1
+    print('rules: %d' % len(policy['rules']))
+    print('compile time: %.3f s' % elapsed)
+    print('entries: %d (%.1f%% of the rules), %d priorities' % (len(entries), 100.0 * len(entries) / count,
+                                                                 levels))
+
+    # Incremental update: 1% of the rules replaced by new ones of their kind
+    acl = acl_policy.AclPolicy(None, threaded=False)
+    acl.rules = [acl_policy.parse_rule(entry) for entry in policy['rules']]
+    if acl.entries(1) is None:
+        return
+    acl.diff(1)
+    rules = policy['rules']
+    rng = random.Random(2)
+    changed = rng.sample(range(len(rules)), count // 100)
+    for position in changed:
+        entry = rules[position] = dict(rules[position])
+        if 'dst_port' in entry:
+            entry['dst_port'] = rng.choice((21, 25, 139, 5900))
+        elif 'eth_src' in entry:
+            entry['eth_src'] = '04:00:00:00:%02x:%02x' % (rng.randrange(256), rng.randrange(256))
+        else:
+            entry['ipv4_src'] = '172.16.%d.%d' % (rng.randrange(256), rng.randrange(256))
+    acl.rules = [acl_policy.parse_rule(entry) for entry in rules]
+    acl.compiled = {}
+    start = time.perf_counter()
+    adds, deletes = acl.diff(1)
+    elapsed = time.perf_counter() - start
+    print('update of %d rules: %d adds, %d deletes (compile and diff %.3f s)' % (len(changed), len(adds),
+                                                                                len(deletes), elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Benchmark of the packet-in path of SimpleSwitch13 (controller.py).
+#
+# Feeds synthetic UDP frames towards an unlearned destination MAC (the same
+# pattern generated by Script_SendDoS.sh) straight into _packet_in_handler,
+# using a stub datapath that discards every message, and reports the number
+# of packet-ins handled per second with the full ryu parser and per-packet
+# INFO logging ("before") and with the fast decoder and sampled logging
+# ("after").
+#
+# Usage: python bench_packet_in.py [number_of_packets]
+
+import logging
+import os
+import sys
+import time
+
+from ryu.lib.packet import packet, ethernet, ipv4, udp, ether_types
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+import controller
+import fast_packet
+
+
+class StubDatapath(object):
+    # Minimal datapath: exposes the OpenFlow 1.3 modules and drops messages
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+
+    def set_xid(self, msg):
+        msg.set_xid(0)
+
+    def send_msg(self, msg):
+        pass
+
+    def send(self, buf):
+        pass
+
+
+class StubPacketIn(object):
+    def __init__(self, datapath, in_port, data):
+        self.datapath = datapath
+        self.match = {'in_port': in_port}
+        self.data = data
+        self.msg_len = len(data)
+        self.total_len = len(data)
+        self.buffer_id = ofproto_v1_3.OFP_NO_BUFFER
+        self.cookie = 0
+
+
+class StubEvent(object):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def build_frames(count):
+    # UDP frames from h1 towards an unknown destination, one source MAC per
+    # frame so every packet-in also exercises MAC learning
+    frames = []
+    for i in range(count):
+        src = '00:00:00:%02x:%02x:%02x' % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff)
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst='00:00:00:00:00:03', src=src,
+                                           ethertype=ether_types.ETH_TYPE_IP))
+        pkt.add_protocol(ipv4.ipv4(src='10.0.0.1', dst='10.0.0.3', proto=17))
+        pkt.add_protocol(udp.udp(src_port=5001, dst_port=5001))
+        pkt.add_protocol(b'\x00' * 1024)
+        pkt.serialize()
+        frames.append(bytes(pkt.data))
+    return frames
+
+
+def run(app, frames):
+    datapath = StubDatapath(1)
+    events = [StubEvent(StubPacketIn(datapath, 1, data)) for data in frames]
+    start = time.perf_counter()
+    for ev in events:
+        app._packet_in_handler(ev)
+    elapsed = time.perf_counter() - start
+    return len(events) / elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # Log lines are formatted and written, but to /dev/null
+    logging.basicConfig(stream=open(os.devnull, 'w'), level=logging.INFO)
+    frames = build_frames(count)
+
+    # The packet-in limiter lets everything through and the port learns every
+    # source, so that every frame is handled and forwarded
+    before = controller.SimpleSwitch13()
+    before.packet_in_limiter.shed = False
+    before.mac_to_port.max_per_port = count
+    before.fast_parse = False
+    before.packet_in_log = fast_packet.PacketInLogSampler(before.logger, interval=0)
+    before_rate = run(before, frames)
+
+    after = controller.SimpleSwitch13()
+    after.packet_in_limiter.shed = False
+    after.mac_to_port.max_per_port = count
+    after_rate = run(after, frames)
+
+    print('packet-ins: %d' % count)
+    print('before (ryu parser, log every packet): %.0f packet-in/s' % before_rate)
+    print('after  (fast decoder, sampled log):    %.0f packet-in/s' % after_rate)
+    print('speedup: %.2fx' % (after_rate / before_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import struct
+import time
+
+# Length of an Ethernet II header: destination MAC, source MAC and ethertype
+ETH_HEADER_LEN = 14
+
+# Ethertype of LLDP frames (same value as ether_types.ETH_TYPE_LLDP)
+ETH_TYPE_LLDP = 0x88cc
+
+# Broadcast destination address, in the textual form used by ryu and as a
+# 48-bit integer
+BROADCAST_MAC = 'ff:ff:ff:ff:ff:ff'
+BROADCAST = 0xffffffffffff
+
+# Precompiled layout of the Ethernet header (network byte order), with each
+# MAC address split in a 32-bit and a 16-bit part
+_ETH_HEADER = struct.Struct('!IHIHH')
+
+
+def parse_eth_header(data):
+    # Decode only the first 14 bytes of the frame instead of building a full
+    # ryu packet.Packet: the learning switch only needs dst, src and ethertype.
+    # MAC addresses are returned as 48-bit integers (see mac_to_int), which
+    # are cheaper to build and to hash than their text; the text is only
+    # needed for OFPMatch and logs (int_to_mac). Returns None if the frame is
+    # too short, so the caller can fall back to the full ryu parser.
+    if len(data) < ETH_HEADER_LEN:
+        return None
+    dst_hi, dst_lo, src_hi, src_lo, ethertype = _ETH_HEADER.unpack_from(data)
+    return (dst_hi << 16) | dst_lo, (src_hi << 16) | src_lo, ethertype
+
+
+def mac_to_int(mac):
+    # 'aa:bb:cc:dd:ee:ff' -> 0xaabbccddeeff
+    return int(mac.replace(':', ''), 16)
+
+
+def int_to_mac(value):
+    # 0xaabbccddeeff -> 'aa:bb:cc:dd:ee:ff', the lowercase text used by ryu
+    return value.to_bytes(6, 'big').hex(':')
+
+
+class PacketInLogSampler(object):
+    # Rate-limited logging of packet-in events: at most one line per interval,
+    # reporting how many packet-ins were received since the previous line.
+    # Logging every packet at INFO level becomes the bottleneck during a flood.
+
+    def __init__(self, logger, interval=1.0):
+        self.logger = logger
+        self.interval = interval  # seconds between two log lines
+        self.suppressed = 0
+        self.last_log_time = 0.0
+
+    def log(self, dpid, src, dst, in_port):
+        # src and dst are 48-bit integers, formatted only when a line is logged
+        now = time.monotonic()
+        if now - self.last_log_time < self.interval:
+            self.suppressed += 1
+            return
+        self.logger.info("packet in %s %s %s %s (%d more since last log)",
+                         dpid, int_to_mac(src), int_to_mac(dst), in_port, self.suppressed)
+        self.suppressed = 0
+        self.last_log_time = now
@@ -0,0 +1,190 @@
+import collections
+import socket
+import struct
+
+import fast_packet
+
+# Mitigation modes of an anomalous port
+MITIGATE_PORT = 'port'  # drop everything received on the port
+MITIGATE_FLOW = 'flow'  # drop only the offending sources
+
+ETH_TYPE_IP = 0x0800
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+_L4_DST_FIELD = {IPPROTO_TCP: 'tcp_dst', IPPROTO_UDP: 'udp_dst'}
+
+
+def parse_ipv4_source(data):
+    # Return (ipv4_src, ip_proto, l4_dst) of an untagged IPv4 frame, with
+    # l4_dst None for protocols other than TCP/UDP, or None for other frames
+    if len(data) < 34 or data[12] != 0x08 or data[13] != 0x00:
+        return None
+    ihl = (data[14] & 0x0f) * 4
+    proto = data[23]
+    l4_dst = None
+    if proto in _L4_DST_FIELD and len(data) >= 14 + ihl + 4:
+        l4_dst = struct.unpack_from('!H', data, 14 + ihl + 2)[0]
+    return socket.inet_ntoa(data[26:30]), proto, l4_dst
+
+
+class SourceSampler(object):
+    # Samples one packet-in out of `every` and counts the sources seen on
+    # each (dpid, in_port) as (eth_src, ipv4_src, ip_proto, l4_dst). At most
+    # max_sources distinct sources are kept per port, so random-source
+    # floods cannot grow the counters without bound.
+
+    def __init__(self, every=10, max_sources=1024):
+        self.every = every
+        self.max_sources = max_sources
+        self.seen = 0
+        self.counts = {}
+
+    def sample(self, dpid, in_port, eth_src, data):
+        # eth_src is the 48-bit integer from fast_packet.parse_eth_header
+        self.seen += 1
+        if self.seen % self.every:
+            return
+        source = (fast_packet.int_to_mac(eth_src),) + (parse_ipv4_source(data) or (None, None, None))
+        counter = self.counts.setdefault((dpid, in_port), collections.Counter())
+        if source in counter or len(counter) < self.max_sources:
+            counter[source] += 1
+
+    def take(self, dpid, port_no):
+        # Sources sampled on the port since the previous call
+        return list(self.counts.pop((dpid, port_no), {}).items())
+
+    def forget_datapath(self, dpid):
+        for key in [key for key in self.counts if key[0] == dpid]:
+            del self.counts[key]
+
+
+def _prefix(address, prefix_len):
+    mask = (0xffffffff << (32 - prefix_len)) & 0xffffffff
+    network = struct.unpack('!I', socket.inet_aton(address))[0] & mask
+    return socket.inet_ntoa(struct.pack('!I', network)), socket.inet_ntoa(struct.pack('!I', mask))
+
+
+def _ip_fields(ipv4_src, proto, l4_dst):
+    fields = {'eth_type': ETH_TYPE_IP, 'ipv4_src': ipv4_src}
+    if proto is not None:
+        fields['ip_proto'] = proto
+        if l4_dst is not None and proto in _L4_DST_FIELD:
+            fields[_L4_DST_FIELD[proto]] = l4_dst
+    return fields
+
+
+class FlowMitigator(object):
+    # Chooses the narrowest set of drop rules covering the offending traffic
+    # of a port. Sources are (eth_src, ipv4_src, ip_proto, l4_dst) tuples
+    # weighted by their traffic. Every port has a baseline share of its
+    # traffic per source, learned while it is below threshold (observe), and
+    # a source is offending by its traffic above that share: a heavy host
+    # sending as usual is left alone, however large its share. All the
+    # offending sources but the lightest ones, together at most min_share of
+    # the excess (the residual), are matched exactly, then grouped by source
+    # MAC, then by IPv4 /24 and /16 prefixes (sources without an IPv4
+    # address by MAC), stopping at the first granularity that needs at most
+    # max_rules rules. None means the whole port has to be blocked.
+
+    def __init__(self, max_rules=16, min_share=0.01, prefix_lens=(24, 16), alpha=0.2):
+        self.max_rules = max_rules
+        self.min_share = min_share
+        self.prefix_lens = prefix_lens
+        self.alpha = alpha  # EWMA weight of a new observation of the baseline
+        self.baselines = {}  # (dpid, port_no) -> {source: share of the traffic of the port}
+        self.residual = 0.0  # share of the excess left out by the last select
+
+    def observe(self, dpid, port_no, sources):
+        # Update the baseline shares of the port with its current sources
+        total = sum(weight for _, weight in sources)
+        if not total:
+            return
+        shares = collections.Counter()
+        for source, weight in sources:
+            shares[source] += weight / total
+        baseline = self.baselines.setdefault((dpid, port_no), {})
+        for source in set(baseline) | set(shares):
+            share = (1 - self.alpha) * baseline.get(source, 0) + self.alpha * shares.get(source, 0)
+            if share < self.min_share / 10:
+                baseline.pop(source, None)
+            else:
+                baseline[source] = share
+
+    def forget_datapath(self, dpid):
+        for key in [key for key in self.baselines if key[0] == dpid]:
+            del self.baselines[key]
+
+    def _cover(self, groups):
+        # The groups, or None if more than max_rules are needed
+        if len(groups) > self.max_rules:
+            return None
+        return sorted(groups, key=groups.get, reverse=True)
+
+    def select(self, sources, dpid=None, port_no=None):
+        # Return the OFPMatch fields (without in_port) of the drop rules
+        self.residual = 0.0
+        if not sources:
+            return None
+
+        exact = collections.Counter()
+        for source, weight in sources:
+            exact[source] += weight
+        total = sum(exact.values())
+        baseline = self.baselines.get((dpid, port_no), {})
+        excess = collections.Counter()
+        for source, weight in exact.items():
+            weight -= baseline.get(source, 0) * total
+            if weight > 0:
+                excess[source] = weight
+        total_excess = sum(excess.values())
+        if not total_excess:
+            return None
+        # The lightest sources, together at most min_share of the excess, are
+        # not worth a rule
+        for source, weight in sorted(excess.items(), key=lambda item: item[1]):
+            if self.residual + weight / total_excess > self.min_share:
+                break
+            self.residual += weight / total_excess
+            del excess[source]
+        sources = list(excess.items())
+
+        selected = self._cover(excess)
+        if selected is not None:
+            rules = []
+            for eth_src, ipv4_src, proto, l4_dst in selected:
+                if ipv4_src is not None:
+                    rules.append(_ip_fields(ipv4_src, proto, l4_dst))
+                else:
+                    rules.append({'eth_src': eth_src})
+            return self._unique(rules)
+
+        by_mac = collections.Counter()
+        for (eth_src, _, _, _), weight in sources:
+            by_mac[eth_src] += weight
+        selected = self._cover(by_mac)
+        if selected is not None:
+            return [{'eth_src': eth_src} for eth_src in selected]
+
+        # IPv4 sources grouped by prefix; the others (ARP, non-IP frames)
+        # keep their rule by MAC
+        for prefix_len in self.prefix_lens:
+            by_prefix = collections.Counter()
+            for (eth_src, ipv4_src, _, _), weight in sources:
+                if ipv4_src is not None:
+                    by_prefix[('ipv4_src', _prefix(ipv4_src, prefix_len))] += weight
+                else:
+                    by_prefix[('eth_src', eth_src)] += weight
+            selected = self._cover(by_prefix)
+            if selected is not None:
+                return [{'eth_type': ETH_TYPE_IP, 'ipv4_src': value} if field == 'ipv4_src'
+                        else {'eth_src': value} for field, value in selected]
+        return None
+
+    @staticmethod
+    def _unique(rules):
+        unique = []
+        for rule in rules:
+            if rule not in unique:
+                unique.append(rule)
+        return unique
@@ -0,0 +1,95 @@
+import time
+from ryu.lib import hub
+
+
+class FlowModQueue(object):
+    # Per-datapath flow programming queue.
+    #
+    # Messages queued while an event handler runs are not written one by one:
+    # they are flushed together on the next event-loop tick (or as soon as
+    # max_batch messages are pending) as a single buffer followed by an
+    # OFPBarrierRequest. When the matching OFPBarrierReply arrives every
+    # message of the batch is known to be installed, the callbacks of the
+    # batch are run and the install latency is recorded. Messages depending
+    # on the batch (the packet-out of a packet-in whose flow is being
+    # installed) are written after its barrier, so the switch processes
+    # them once the flows are in place.
+
+    def __init__(self, logger, max_batch=64, metrics=None):
+        self.logger = logger
+        self.max_batch = max_batch
+        self.metrics = metrics  # optional metrics.Metrics of the app
+        # dpid -> (datapath, [messages], [callbacks], [messages after the barrier])
+        self.pending = {}
+        # (dpid, barrier xid) -> (send time, [callbacks], number of messages)
+        self.in_flight = {}
+        # dpid -> {'batches', 'messages', 'total', 'max', 'last'} latencies in seconds
+        self.latency = {}
+
+    def send(self, datapath, msg, callback=None):
+        dpid = datapath.id
+        batch = self.pending.get(dpid)
+        if batch is None:
+            batch = self.pending[dpid] = (datapath, [], [], [])
+            # Flush once the current handler yields to the event loop
+            hub.spawn(self.flush, dpid)
+        batch[1].append(msg)
+        if callback is not None:
+            batch[2].append(callback)
+        if len(batch[1]) >= self.max_batch:
+            self.flush(dpid)
+
+    def send_after(self, datapath, msg):
+        # Write msg after the barrier of the pending batch (at once if none)
+        batch = self.pending.get(datapath.id)
+        if batch is None:
+            datapath.send_msg(msg)
+        else:
+            batch[3].append(msg)
+
+    def flush(self, dpid):
+        batch = self.pending.pop(dpid, None)
+        if batch is None:
+            return
+        datapath, msgs, callbacks, after = batch
+        parser = datapath.ofproto_parser
+
+        barrier = parser.OFPBarrierRequest(datapath)
+        buf = bytearray()
+        for msg in msgs + [barrier] + after:
+            datapath.set_xid(msg)
+            msg.serialize()
+            buf += msg.buf
+        self.in_flight[(dpid, barrier.xid)] = (time.monotonic(), callbacks, len(msgs))
+        # One write for the whole batch instead of one per message
+        datapath.send(bytes(buf))
+        if self.metrics is not None:
+            self.metrics.inc('sdn_flow_mods_total', (dpid,), len(msgs))
+
+    def barrier_reply(self, msg):
+        # Called on EventOFPBarrierReply: confirm the batch closed by the barrier
+        dpid = msg.datapath.id
+        entry = self.in_flight.pop((dpid, msg.xid), None)
+        if entry is None:
+            return
+        sent, callbacks, count = entry
+        elapsed = time.monotonic() - sent
+
+        stats = self.latency.setdefault(dpid, {'batches': 0, 'messages': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0})
+        stats['batches'] += 1
+        stats['messages'] += count
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+        stats['last'] = elapsed
+        self.logger.debug('switch %s installed %d flow mods in %.3f ms', dpid, count, elapsed * 1000)
+        if self.metrics is not None:
+            self.metrics.observe('sdn_flow_mod_batch_seconds', elapsed)
+
+        for callback in callbacks:
+            callback()
+
+    def forget_datapath(self, dpid):
+        # Drop the pending and unconfirmed batches of a disconnected switch
+        self.pending.pop(dpid, None)
+        for key in [key for key in self.in_flight if key[0] == dpid]:
+            del self.in_flight[key]
@@ -0,0 +1,145 @@
+import heapq
+
+import pipeline
+
+# Cookies tagging the flows installed by the controller, so that flow stats
+# requests can be restricted to one kind of rule
+COOKIE_L2 = 0x1  # learned L2 forwarding flows
+COOKIE_SECURITY = 0x2  # block rules
+COOKIE_ACL = 0x3  # entries of the static firewall policy
+COOKIE_METER = 0x4  # entries of the metered ports
+COOKIE_MASK = 0xffffffffffffffff
+
+# Flow statistics requested with each full switch poll
+STATS_PORT = 'port'  # port stats only, no flow statistics
+STATS_AGGREGATE = 'aggregate'  # one OFPAggregateStatsRequest (flow count, total bytes)
+STATS_SECURITY = 'security'  # flow stats of the block rules only, for the traffic they drop
+STATS_TALKERS = 'talkers'  # flow stats of the L2 flows, for top talker detection
+
+STATS_POLICIES = (STATS_PORT, STATS_AGGREGATE, STATS_SECURITY, STATS_TALKERS)
+
+
+def request_flow_stats(datapath, policy):
+    # Send the flow statistics request of the given policy, if any
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+
+    if policy == STATS_PORT:
+        return
+    # Per-table statistics of the pipeline, with every flow statistics policy
+    datapath.send_msg(parser.OFPTableStatsRequest(datapath, 0))
+    if policy == STATS_AGGREGATE:
+        # The forwarding table only: every packet crosses all the tables
+        req = parser.OFPAggregateStatsRequest(datapath, 0, pipeline.TABLE_L2,
+                                              ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                              0, 0, parser.OFPMatch())
+    elif policy == STATS_SECURITY:
+        req = parser.OFPFlowStatsRequest(datapath, 0, pipeline.TABLE_SECURITY,
+                                         ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                         COOKIE_SECURITY, COOKIE_MASK, parser.OFPMatch())
+    elif policy == STATS_TALKERS:
+        req = parser.OFPFlowStatsRequest(datapath, 0, pipeline.TABLE_L2,
+                                         ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                         COOKIE_L2, COOKIE_MASK, parser.OFPMatch())
+    else:
+        raise ValueError('Unknown stats policy %s' % policy)
+    datapath.send_msg(req)
+
+
+class FlowStatsTracker(object):
+    # Consumer of flow and aggregate stats replies.
+    #
+    # From the L2 flows it computes the byte rate sent by every source MAC
+    # (summed over all its flows) to find the top talkers of each switch; from
+    # the block rules it computes the byte rate they drop on every port,
+    # which the detectors leave out of the received throughput.
+
+    def __init__(self):
+        self.partial = {}  # dpid -> flow stats of a multipart reply being received
+        self.mac_bytes = {}  # dpid -> {eth_src: byte count}
+        self.mac_rates = {}  # dpid -> {eth_src: bytes per second}
+        self.mac_ports = {}  # dpid -> {eth_src: in_port of its flows}
+        self.last_update = {}  # dpid -> timestamp of the last complete reply
+        self.security_bytes = {}  # dpid -> {in_port: bytes dropped by its block rules}
+        self.security_update = {}  # dpid -> timestamp of the last reply with the block rules
+        self.dropped_rates = {}  # dpid -> {in_port: bytes per second dropped by its block rules}
+        self.aggregate = {}  # dpid -> (flow count, packet count, byte count)
+
+    def flow_stats(self, dpid, body, more, now):
+        # Called for every part of an OFPFlowStatsReply; the stats are only
+        # evaluated once the last part has arrived
+        self.partial.setdefault(dpid, []).extend(body)
+        if more:
+            return
+        stats = self.partial.pop(dpid)
+
+        mac_bytes = {}
+        mac_ports = {}
+        dropped = {}
+        for stat in stats:
+            if stat.cookie == COOKIE_SECURITY:
+                in_port = stat.match.get('in_port')
+                dropped[in_port] = dropped.get(in_port, 0) + stat.byte_count
+                continue
+            src = stat.match.get('eth_src')
+            if src is not None:
+                mac_bytes[src] = mac_bytes.get(src, 0) + stat.byte_count
+                mac_ports[src] = stat.match.get('in_port')
+        if not mac_bytes:
+            # Reply of the block rules (policy STATS_SECURITY)
+            self._dropped(dpid, dropped, now)
+            return
+
+        prev_bytes = self.mac_bytes.get(dpid)
+        prev_time = self.last_update.get(dpid)
+        self.mac_bytes[dpid] = mac_bytes
+        self.mac_ports[dpid] = mac_ports
+        self.last_update[dpid] = now
+        if prev_bytes is None or now <= prev_time:
+            return
+        interval = now - prev_time
+        # Flows removed between two replies can make the sum go down
+        self.mac_rates[dpid] = dict((mac, max(0, count - prev_bytes.get(mac, 0)) / interval)
+                                    for mac, count in mac_bytes.items())
+
+    def _dropped(self, dpid, dropped, now):
+        prev_bytes = self.security_bytes.get(dpid)
+        prev_time = self.security_update.get(dpid)
+        self.security_bytes[dpid] = dropped
+        self.security_update[dpid] = now
+        rates = {}
+        if prev_bytes is not None and now > prev_time:
+            for in_port, count in dropped.items():
+                # Rules installed again count from zero
+                delta = count - prev_bytes.get(in_port, 0)
+                rates[in_port] = (delta if delta >= 0 else count) / (now - prev_time)
+        self.dropped_rates[dpid] = rates
+
+    def dropped_rate(self, dpid, port_no):
+        # Bytes per second dropped by the block rules of the port
+        return self.dropped_rates.get(dpid, {}).get(port_no, 0)
+
+    def port_unblocked(self, dpid, port_no):
+        # The block rules of the port have left the switch
+        self.security_bytes.get(dpid, {}).pop(port_no, None)
+        self.dropped_rates.get(dpid, {}).pop(port_no, None)
+
+    def aggregate_stats(self, dpid, stat):
+        self.aggregate[dpid] = (stat.flow_count, stat.packet_count, stat.byte_count)
+
+    def top_talkers(self, dpid, n=5):
+        # The n source MACs with the highest byte rate on the switch
+        rates = self.mac_rates.get(dpid, {})
+        return heapq.nlargest(n, rates.items(), key=lambda item: item[1])
+
+    def sources(self, dpid, port_no):
+        # Source MACs entering the switch on the port with their byte rate, as
+        # (eth_src, ipv4_src, ip_proto, l4_dst) sources for flow mitigation
+        ports = self.mac_ports.get(dpid, {})
+        return [((mac, None, None, None), rate) for mac, rate in self.mac_rates.get(dpid, {}).items()
+                if ports.get(mac) == port_no and rate > 0]
+
+    def forget_datapath(self, dpid):
+        for table in (self.partial, self.mac_bytes, self.mac_rates, self.mac_ports, self.last_update, self.aggregate,
+                      self.security_bytes, self.security_update, self.dropped_rates):
+            table.pop(dpid, None)
@@ -0,0 +1,71 @@
+class FlowTable(object):
+    # Lifecycle of the learned L2 flows of each switch.
+    #
+    # L2 flows are installed with idle/hard timeouts and OFPFF_SEND_FLOW_REM;
+    # the flows of every switch are tracked by key (in_port, eth_dst, eth_src)
+    # from the FlowMods sent and the FlowRemoved messages received, so the
+    # occupancy of the table is known without polling. Once it reaches
+    # coarse_ratio of capacity, new flows match the destination only
+    # (key (None, eth_dst, None)): one flow per destination for all sources,
+    # so that a MAC-spoofing flood cannot fill the table.
+
+    def __init__(self, idle_timeout=30, hard_timeout=300, capacity=10000, coarse_ratio=0.8):
+        self.idle_timeout = idle_timeout  # seconds, 0 for no timeout
+        self.hard_timeout = hard_timeout  # seconds, 0 for no timeout
+        self.capacity = capacity  # flows per switch
+        self.coarse_ratio = coarse_ratio
+        self.flows = {}  # dpid -> set of flow keys
+        self.src_flows = {}  # dpid -> {eth_src: number of flows}
+        self.reported = {}  # dpid -> flow count of the last aggregate stats reply
+
+    def occupancy(self, dpid):
+        # The aggregate flow count also covers flows not installed by this app
+        return max(len(self.flows.get(dpid, ())), self.reported.get(dpid, 0))
+
+    def coarse(self, dpid):
+        return self.occupancy(dpid) >= self.coarse_ratio * self.capacity
+
+    def installed(self, dpid, key):
+        flows = self.flows.setdefault(dpid, set())
+        if key in flows:
+            # Same flow added again by a packet-in racing the first FlowMod
+            return
+        flows.add(key)
+        src = key[2]
+        if src is not None:
+            src_flows = self.src_flows.setdefault(dpid, {})
+            src_flows[src] = src_flows.get(src, 0) + 1
+
+    def removed(self, dpid, key):
+        # Returns True if the source of the flow has no flow left
+        flows = self.flows.get(dpid)
+        if not flows or key not in flows:
+            return False
+        flows.discard(key)
+        src = key[2]
+        if src is None:
+            return False
+        src_flows = self.src_flows[dpid]
+        src_flows[src] -= 1
+        if src_flows[src] > 0:
+            return False
+        del src_flows[src]
+        return True
+
+    def sync(self, dpid, matches):
+        # Replace the tracked flows with the L2 flows read from the switch
+        self.flows.pop(dpid, None)
+        self.src_flows.pop(dpid, None)
+        for match in matches:
+            self.installed(dpid, flow_key(match))
+
+    def aggregate(self, dpid, flow_count):
+        self.reported[dpid] = flow_count
+
+    def forget_datapath(self, dpid):
+        for table in (self.flows, self.src_flows, self.reported):
+            table.pop(dpid, None)
+
+
+def flow_key(match):
+    return match.get('in_port'), match.get('eth_dst'), match.get('eth_src')
@@ -0,0 +1,74 @@
+import json
+import os
+
+
+class LinkCapacity(object):
+    # Capacity of every switch port, loaded from the link bandwidth file
+    # exported by the topology scripts:
+    #
+    #   {"ports": [{"dpid": 1, "port": 1, "switch": "s1", "peer": "h1", "bw": 6}, ...]}
+    #
+    # with bw in Mbit/s. capacity and thresholds map (dpid, port_no) to
+    # bytes/s, so the stats handlers need a single dict lookup per port. The
+    # file is reloaded when its modification time changes.
+
+    def __init__(self, path, threshold_ratio=0.8, check_interval=5, logger=None):
+        self.path = path
+        self.threshold_ratio = threshold_ratio  # share of the capacity used as static threshold
+        self.check_interval = check_interval  # seconds between two checks of the file
+        self.logger = logger
+        self.capacity = {}
+        self.thresholds = {}
+        self.ports = []  # entries of the file, for the topology graph
+        self.mtime = None
+        self.last_check = None
+        self.error = None  # last error, logged once
+
+    def load(self):
+        # (Re)load the file; returns True if the table changed
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            self._error('Could not load link bandwidth file: %s' % e)
+            return False
+        if mtime == self.mtime:
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                ports = json.load(f).get('ports', [])
+            capacity = {}
+            for entry in ports:
+                capacity[(int(entry['dpid']), int(entry['port']))] = entry['bw'] * 10**6 / 8
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            # Empty, partially written or malformed file: keep the current table
+            self._error('Invalid link bandwidth file %s: %s' % (self.path, e))
+            return False
+
+        # Only a file that loaded is not read again: a bad one is retried
+        # until it is fixed
+        self.mtime = mtime
+        self.error = None
+        self.capacity = capacity
+        self.ports = ports
+        self.thresholds = dict((key, value * self.threshold_ratio) for key, value in capacity.items())
+        if self.logger is not None:
+            self.logger.info('Loaded the capacity of %d ports from %s', len(capacity), self.path)
+        return True
+
+    def _error(self, message):
+        if message != self.error and self.logger is not None:
+            self.logger.error(message)
+        self.error = message
+
+    def refresh(self, now):
+        # Reload the file if it changed, at most once per check_interval
+        if self.last_check is not None and now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+        return self.load()
+
+    def min_threshold(self, default):
+        # Lowest static threshold of all the known ports
+        if not self.thresholds:
+            return default
+        return min(self.thresholds.values())
@@ -0,0 +1,30 @@
+# SDN firewall with the inter-switch links discovered by ryu's LLDP topology
+# discovery added to its topology graph (see topology_graph.py), for networks
+# without a link bandwidth file or whose links change. The SDN firewall app
+# (sdn_firewall.py) with its default options; ryu.topology is only loaded by
+# this app.
+#
+#   ryu-manager --observe-links lldp_firewall.py
+from ryu.controller.handler import set_ev_cls
+from ryu.topology import event as topology_event
+
+import sdn_firewall
+
+
+class SimpleSwitch13(sdn_firewall.SimpleSwitch13):
+    CONFIG = {}
+
+    @set_ev_cls(topology_event.EventLinkAdd)
+    def _link_add_handler(self, ev):
+        src, dst = ev.link.src, ev.link.dst
+        self.topology.link_added(src.dpid, src.port_no, dst.dpid, dst.port_no)
+
+    @set_ev_cls(topology_event.EventLinkDelete)
+    def _link_delete_handler(self, ev):
+        self.topology.link_deleted(ev.link.src.dpid, ev.link.src.port_no)
+
+
+# Main function
+if __name__ == '__main__':
+    from ryu.cmd import manager
+    manager.main()
@@ -0,0 +1,136 @@
+import collections
+
+from ryu.controller import event
+
+# Results of MacTable.learn
+LEARNED = 'learned'  # new MAC address
+MOVED = 'moved'  # known MAC address seen on another port
+REFRESHED = 'refreshed'  # known MAC address seen again on the same port
+VIOLATION = 'violation'  # port over its MAC limit, first refused address
+REJECTED = 'rejected'  # port over its MAC limit, address refused
+
+
+class EventPortSecurityViolation(event.EventBase):
+    # Sent to the observers of the app when a port exceeds its MAC limit
+    def __init__(self, dpid, port_no, mac):
+        super(EventPortSecurityViolation, self).__init__()
+        self.dpid = dpid
+        self.port_no = port_no
+        self.mac = mac  # 48-bit integer of the first refused address
+
+
+class MacEntry(object):
+    __slots__ = ('port', 'seen')
+
+    def __init__(self, port, seen):
+        self.port = port
+        self.seen = seen
+
+
+class MacTable(object):
+    # Learned MAC addresses of every switch, keyed by 48-bit integers (see
+    # fast_packet.parse_eth_header). Each switch has an OrderedDict in least
+    # recently seen order, so aging (max_age seconds without frames) and
+    # eviction of the oldest address when the switch holds max_per_switch
+    # addresses only look at its head. A port learns at most max_per_port
+    # addresses unless learned as not limited (inter-switch links); further
+    # addresses are refused until some age out, which
+    # keeps memory flat under random source MAC floods. on_remove(dpid, mac)
+    # is called for every address aged out, evicted or forgotten.
+
+    def __init__(self, max_age=300, max_per_port=256, max_per_switch=8192, on_remove=None):
+        self.max_age = max_age
+        self.max_per_port = max_per_port
+        self.max_per_switch = max_per_switch
+        self.on_remove = on_remove
+        self.switches = {}  # dpid -> OrderedDict {mac: MacEntry}
+        self.port_counts = {}  # (dpid, port_no) -> number of addresses learned on the port
+        self.violations = set()  # (dpid, port_no) over their limit
+
+    def learn(self, dpid, mac, port, now, limited=True):
+        table = self.switches.get(dpid)
+        if table is None:
+            table = self.switches[dpid] = collections.OrderedDict()
+        entry = table.get(mac)
+        if entry is not None and entry.port == port:
+            entry.seen = now
+            table.move_to_end(mac)
+            return REFRESHED
+
+        key = (dpid, port)
+        count = self.port_counts.get(key, 0)
+        if limited and count >= self.max_per_port:
+            if key in self.violations:
+                return REJECTED
+            self.violations.add(key)
+            return VIOLATION
+        self.port_counts[key] = count + 1
+
+        if entry is not None:
+            self._uncount(dpid, entry.port)
+            entry.port = port
+            entry.seen = now
+            table.move_to_end(mac)
+            return MOVED
+
+        table[mac] = MacEntry(port, now)
+        if len(table) > self.max_per_switch:
+            old_mac, old_entry = table.popitem(last=False)
+            self._removed(dpid, old_mac, old_entry)
+        return LEARNED
+
+    def lookup(self, dpid, mac):
+        # Port of the address, or None if it is unknown
+        table = self.switches.get(dpid)
+        if table is None:
+            return None
+        entry = table.get(mac)
+        return entry.port if entry is not None else None
+
+    def forget(self, dpid, mac, port=None):
+        # Remove the address (only if it is on `port`, when given)
+        table = self.switches.get(dpid)
+        entry = table.get(mac) if table is not None else None
+        if entry is None or (port is not None and entry.port != port):
+            return False
+        del table[mac]
+        self._removed(dpid, mac, entry)
+        return True
+
+    def expire(self, now):
+        # Remove the addresses not seen for max_age seconds
+        for dpid, table in self.switches.items():
+            while table:
+                mac, entry = next(iter(table.items()))
+                if now - entry.seen < self.max_age:
+                    break
+                del table[mac]
+                self._removed(dpid, mac, entry)
+
+    def items(self, dpid):
+        # (mac, port) of the addresses of the switch
+        table = self.switches.get(dpid, {})
+        return [(mac, entry.port) for mac, entry in table.items()]
+
+    def __len__(self):
+        return sum(len(table) for table in self.switches.values())
+
+    def forget_datapath(self, dpid):
+        self.switches.pop(dpid, None)
+        for key in [key for key in self.port_counts if key[0] == dpid]:
+            del self.port_counts[key]
+        self.violations = set(key for key in self.violations if key[0] != dpid)
+
+    def _removed(self, dpid, mac, entry):
+        self._uncount(dpid, entry.port)
+        if self.on_remove is not None:
+            self.on_remove(dpid, mac)
+
+    def _uncount(self, dpid, port):
+        key = (dpid, port)
+        count = self.port_counts.get(key, 0) - 1
+        if count > 0:
+            self.port_counts[key] = count
+        else:
+            self.port_counts.pop(key, None)
+        self.violations.discard(key)
@@ -0,0 +1,65 @@
+import rate_limiter
+
+# Mitigation mode rate-limiting an anomalous port with an OpenFlow meter
+# before dropping its traffic
+MITIGATE_METER = 'meter'
+
+
+class MeterState(object):
+    # Meter of the traffic entering a switch on one port (entry of the
+    # metering table, see pipeline.py)
+    __slots__ = ('meter_id', 'rate_kbps', 'since', 'below_since')
+
+    def __init__(self, meter_id, rate_kbps, since):
+        self.meter_id = meter_id
+        self.rate_kbps = rate_kbps
+        self.since = since  # time the port was metered
+        self.below_since = None  # time the port went back below threshold
+
+
+class MeterAllocator(object):
+    # Meter ids of each switch; the packet-in meter id is never handed out
+
+    def __init__(self, first_id=rate_limiter.PACKET_IN_METER_ID + 1):
+        self.first_id = first_id
+        self.next_id = {}
+        self.free = {}
+
+    def allocate(self, dpid):
+        free = self.free.get(dpid)
+        if free:
+            return free.pop()
+        meter_id = self.next_id.get(dpid, self.first_id)
+        self.next_id[dpid] = meter_id + 1
+        return meter_id
+
+    def reserve(self, dpid, meter_id):
+        # Mark a meter id restored from a snapshot as in use
+        self.next_id[dpid] = max(self.next_id.get(dpid, self.first_id), meter_id + 1)
+
+    def release(self, dpid, meter_id):
+        free = self.free.setdefault(dpid, [])
+        if meter_id not in free:
+            free.append(meter_id)
+
+
+def instruction_meter(datapath, instructions):
+    # Meter id of the instructions of an entry read from a switch, if any
+    parser = datapath.ofproto_parser
+    for inst in instructions:
+        if isinstance(inst, parser.OFPInstructionMeter):
+            return inst.meter_id
+    return None
+
+
+def meter_mod(datapath, command, meter_id, rate_kbps=0):
+    # OFPMeterMod with a single drop band at rate_kbps (burst of one second)
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+
+    bands = []
+    if command != ofproto.OFPMC_DELETE:
+        bands = [parser.OFPMeterBandDrop(rate=rate_kbps, burst_size=rate_kbps)]
+    return parser.OFPMeterMod(datapath=datapath, command=command,
+                              flags=ofproto.OFPMF_KBPS | ofproto.OFPMF_BURST,
+                              meter_id=meter_id, bands=bands)
@@ -0,0 +1,167 @@
+import bisect
+import functools
+import socket
+import time
+
+from ryu.lib import hub
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# name -> (type, help, label names) of the controller metrics. Per-switch
+# metrics have dpid as first label, so they can be dropped on disconnect.
+CONTROLLER_METRICS = {
+    'sdn_port_rx_bytes_per_second': (GAUGE, 'Received throughput of a switch port', ('dpid', 'port')),
+    'sdn_port_tx_bytes_per_second': (GAUGE, 'Transmitted throughput of a switch port', ('dpid', 'port')),
+    'sdn_port_threshold_bytes_per_second': (GAUGE, 'Current threshold of a switch port', ('dpid', 'port')),
+    'sdn_packet_in_total': (COUNTER, 'Packet-ins received from a switch', ('dpid',)),
+    'sdn_packet_in_shed_total': (COUNTER, 'Packet-ins dropped by the packet-in limiter', ('dpid',)),
+    'sdn_packet_in_handler_seconds': (HISTOGRAM, 'Run time of the packet-in handler', ()),
+    'sdn_port_stats_handler_seconds': (HISTOGRAM, 'Run time of the port stats reply handler', ()),
+    'sdn_flow_mods_total': (COUNTER, 'FlowMods and MeterMods written to a switch', ('dpid',)),
+    'sdn_flow_mod_batch_seconds': (HISTOGRAM, 'Time between a FlowMod batch and its barrier reply', ()),
+    'sdn_port_blocks_total': (COUNTER, 'Blocks of a switch port', ('dpid', 'port')),
+    'sdn_port_unblocks_total': (COUNTER, 'Unblocks of a switch port', ('dpid', 'port')),
+    'sdn_alerts_localized_total': (COUNTER, 'Alerts of a port left to the ingress edge port upstream',
+                                   ('dpid', 'port')),
+    'sdn_port_security_violations_total': (COUNTER, 'Ports exceeding their MAC address limit',
+                                           ('dpid', 'port')),
+    'sdn_flow_table_occupancy': (GAUGE, 'Flows in the table of a switch', ('dpid',)),
+    'sdn_table_active_entries': (GAUGE, 'Entries of a pipeline table of a switch', ('dpid', 'table')),
+    'sdn_table_lookups_total': (COUNTER, 'Packets looked up in a pipeline table of a switch', ('dpid', 'table')),
+    'sdn_table_matched_total': (COUNTER, 'Packets matching an entry of a pipeline table of a switch',
+                                ('dpid', 'table')),
+    'sdn_sflow_datagrams_total': (COUNTER, 'Datagrams received by the sFlow collector', ()),
+    'sdn_sflow_malformed_total': (COUNTER, 'Malformed datagrams dropped by the sFlow collector', ()),
+    'sdn_stats_worker_backlog': (GAUGE, 'Port stats replies waiting for the stats worker', ()),
+    'sdn_handler_seconds': (HISTOGRAM, 'Run time of an event handler (profiling only)', ('handler',)),
+    'sdn_event_queue_depth': (GAUGE, 'Events waiting in the event queue of the app (profiling only)', ()),
+}
+
+
+def timed(name):
+    # Record the run time of an event handler in the histogram `name` of the
+    # app's metrics. Put it below @set_ev_cls.
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, ev):
+            start = time.perf_counter()
+            try:
+                return handler(self, ev)
+            finally:
+                self.metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, value) for name, value in zip(names, values))
+
+
+class Metrics(object):
+    # In-memory metrics of the controller. Updating a metric is a dict
+    # operation done by the event handlers; the Prometheus text format is only
+    # built when the /metrics endpoint is scraped.
+
+    def __init__(self, definitions=CONTROLLER_METRICS, buckets=LATENCY_BUCKETS):
+        self.definitions = definitions
+        self.buckets = buckets
+        # name -> {label values: value}; histogram values are
+        # [bucket counts (last one is +Inf), sum of the observations]
+        self.values = dict((name, {}) for name in definitions)
+
+    def inc(self, name, labels=(), value=1):
+        series = self.values[name]
+        series[labels] = series.get(labels, 0) + value
+
+    def set(self, name, labels, value):
+        self.values[name][labels] = value
+
+    def observe(self, name, value, labels=()):
+        series = self.values[name]
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+
+    def forget_datapath(self, dpid):
+        for series in self.values.values():
+            for labels in [labels for labels in series if labels and labels[0] == dpid]:
+                del series[labels]
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for name in sorted(self.definitions):
+            kind, help_text, label_names = self.definitions[name]
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in sorted(self.values[name].items()):
+                if kind != HISTOGRAM:
+                    lines.append('%s%s %s' % (name, _format_labels(label_names, labels), repr(float(value))))
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(self.buckets + (None,), counts):
+                    cumulative += count
+                    le = '+Inf' if bound is None else repr(bound)
+                    lines.append('%s_bucket%s %d' % (name, _format_labels(label_names + ('le',), labels + (le,)),
+                                                     cumulative))
+                lines.append('%s_sum%s %s' % (name, _format_labels(label_names, labels), repr(total)))
+                lines.append('%s_count%s %d' % (name, _format_labels(label_names, labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+class BadRequest(ValueError):
+    # Raised by a route for invalid parameters: answered with a 400
+    pass
+
+
+class MetricsServer(object):
+    # WSGI application serving the metrics on http://host:port/metrics, run
+    # in its own green thread so scrapes never block the event handlers.
+    # routes maps other paths to functions of the WSGI environ returning text
+    # (or raising BadRequest).
+
+    def __init__(self, metrics, host='127.0.0.1', port=8000, logger=None, routes=None):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.logger = logger
+        self.routes = routes or {}
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO')
+        if path == '/metrics':
+            text = self.metrics.render()
+        elif path in self.routes:
+            try:
+                text = self.routes[path](environ)
+            except BadRequest as e:
+                start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+                return [('%s\n' % e).encode('utf-8')]
+        else:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found\n']
+        body = text.encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    def serve(self):
+        try:
+            server = hub.WSGIServer((self.host, self.port), self)
+        except socket.error as e:
+            if self.logger is not None:
+                self.logger.error('Could not start the metrics endpoint on %s:%s: %s', self.host, self.port, e)
+            return
+        if self.logger is not None:
+            self.logger.info('Serving metrics on http://%s:%s/metrics', self.host, self.port)
+        server.serve_forever()
@@ -1,5 +1,6 @@
 # Import necessary functions from Mininet
 import json
+import os
 from mininet.log import setLogLevel, info
 from mininet.net import Mininet, CLI
 from mininet.node import OVSKernelSwitch, RemoteController
@@ -14,6 +15,13 @@ class Environment(object):
         # Adding and starting the controller
         c1 = self.net.addController('c1', controller=RemoteController)  # Controller
         c1.start()
+        # Sharded controller (see shard.py): the switches also connect to the
+        # other workers, which listen on the following OpenFlow ports
+        shards = int(os.environ.get('SDN_SHARD_COUNT', '1'))
+        base_port = int(os.environ.get('SDN_SHARD_BASE_PORT', '6653'))
+        for index in range(1, shards):
+            c = self.net.addController('c%d' % (index + 1), controller=RemoteController, port=base_port + index)
+            c.start()
         info("*** Adding hosts and switches\n")
         # Adding hosts (h1, h2, h3, h4) and switches (cpe1, cpe2, core1, cpe3) to the network
         self.h1 = self.net.addHost('h1', mac='00:00:00:00:00:01', ip='10.0.0.1')
@@ -42,7 +50,11 @@ class Environment(object):
         self.export_link_bandwidth()
 
     def export_link_bandwidth(self):
+        # "links" maps node names to the bandwidth of their links, "ports" gives
+        # the bandwidth of every switch port as (dpid, port number) for the controller,
+        # with the ifindex of its interface that identifies it in sFlow samples
         link_bandwidth = {}
+        ports = []
         for link in self.net.links:
             node1, node2 = link.intf1.node, link.intf2.node
             bw = link.intf1.params.get('bw', None)
@@ -53,9 +65,28 @@ class Environment(object):
                     link_bandwidth[node2.name] = {}
                 link_bandwidth[node1.name][node2.name] = bw
                 link_bandwidth[node2.name][node1.name] = bw
+                for intf, peer in ((link.intf1, node2), (link.intf2, node1)):
+                    if intf.node in self.net.switches:
+                        ports.append({'dpid': int(intf.node.dpid, 16), 'port': intf.node.ports[intf],
+                                      'switch': intf.node.name, 'peer': peer.name, 'bw': bw,
+                                      'ifindex': self.ifindex(intf.name)})
 
-        with open('/home/so/Scrivania/Progetto_NCI/link_bandwidth.json', 'w') as f:
-            json.dump(link_bandwidth, f)
+        # Written to a temporary file and renamed, so the controller never reads a partial file.
+        # Same location as the bandwidth_file default of the controller (sdn_config.py)
+        path = os.environ.get('SDN_BANDWIDTH_FILE',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'link_bandwidth.json'))
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'links': link_bandwidth, 'ports': ports}, f)
+        os.rename(path + '.tmp', path)
+
+    @staticmethod
+    def ifindex(name):
+        # Switch interfaces are in the root namespace
+        try:
+            with open('/sys/class/net/%s/ifindex' % name) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
 
 # Main function
 if __name__ == '__main__':
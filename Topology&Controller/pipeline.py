@@ -0,0 +1,38 @@
+# OpenFlow tables of the controller pipeline, linked by goto-table
+# instructions:
+#
+#   0 security    block rules and firewall policy entries; misses go on
+#   1 metering    one entry per metered port (meter, then goto); its table
+#                 stats give the traffic accounted before forwarding
+#   2 forwarding  learned L2 flows; misses go to the controller
+#
+# Block and unblock only change the small security table, MAC learning only
+# the forwarding table, and the stats of each stage are one table stats
+# request away.
+
+TABLE_SECURITY = 0
+TABLE_METERING = 1
+TABLE_L2 = 2
+
+TABLES = {TABLE_SECURITY: 'security', TABLE_METERING: 'metering', TABLE_L2: 'forwarding'}
+
+# Priority of the entries of metered ports
+METER_PRIORITY = 1
+
+
+def table_miss_mods(datapath):
+    # Table-miss entries of the security and metering tables, going on to the
+    # next table (the forwarding table misses to the controller, installed
+    # by the app)
+    parser = datapath.ofproto_parser
+
+    return [parser.OFPFlowMod(datapath=datapath, table_id=table_id, priority=0, match=parser.OFPMatch(),
+                              instructions=[parser.OFPInstructionGotoTable(table_id + 1)])
+            for table_id in (TABLE_SECURITY, TABLE_METERING)]
+
+
+def goes_to(datapath, instructions, table_id):
+    # Whether the instructions of an entry read from a switch continue to table_id
+    parser = datapath.ofproto_parser
+    return any(isinstance(inst, parser.OFPInstructionGotoTable) and inst.table_id == table_id
+               for inst in instructions)
@@ -0,0 +1,142 @@
+# Block state of the anomalous ports. A port exceeding its threshold gets a
+# PortState object going through
+#
+#   IDLE      not blocked; `since` is the start of the current excess
+#   BLOCKING  block rules sent, waiting for their barrier reply
+#   BLOCKED   block rules on the switch
+#
+# The block rules expire on the switch (hard timeout, or idle timeout once
+# the sources are silent) and are reported by FlowRemoved messages, so a
+# port is unblocked without the controller timing it and also when the
+# controller is slow or away. The hard timeout doubles with every block of
+# a repeat offender, blocked again at once when it exceeds its threshold
+# within the duration of its last block; a port that stayed below threshold
+# that long is forgotten.
+
+IDLE = 'idle'
+BLOCKING = 'blocking'
+BLOCKED = 'blocked'
+
+# Longest block, in seconds (hard_timeout is 16 bits)
+MAX_TIMEOUT = 3600
+
+
+class PortState(object):
+    __slots__ = ('state', 'since', 'rules', 'left', 'timeout', 'strikes', 'released')
+
+    def __init__(self):
+        self.state = IDLE
+        self.since = None  # time the port went above threshold
+        self.rules = []  # match fields of the block rules
+        self.left = 0  # block rules still on the switch
+        self.timeout = 0  # hard timeout of the last block (0: permanent)
+        self.strikes = 0  # blocks of a repeat offender before the last one
+        self.released = None  # time the last block expired
+
+
+class PortStates(object):
+    # PortState of every (dpid, port_no) that is above threshold, blocked or
+    # remembered as a repeat offender; other ports have none, so a sample of
+    # a normal port is a single lookup
+
+    def __init__(self, block_window, unlock_timeout, max_timeout=MAX_TIMEOUT):
+        self.block_window = block_window  # seconds above threshold before a block (0: at once)
+        self.unlock_timeout = unlock_timeout  # first block duration (None: blocks are permanent)
+        self.max_timeout = max_timeout
+        self.ports = {}
+
+    def get(self, key):
+        return self.ports.get(key)
+
+    def blocked(self, key):
+        # Blocked, or its block rules are being installed
+        port = self.ports.get(key)
+        return port is not None and port.state != IDLE
+
+    def count(self, dpid):
+        return len([key for key, port in self.ports.items() if key[0] == dpid and port.state != IDLE])
+
+    def sample(self, key, exceeded, timestamp):
+        # Record a detector decision; returns the PortState of the port, if any
+        port = self.ports.get(key)
+        if exceeded:
+            if port is None:
+                port = self.ports[key] = PortState()
+            if port.since is None:
+                port.since = timestamp
+        elif port is not None:
+            port.since = None
+            if port.state == IDLE and (port.released is None or timestamp - port.released > port.timeout):
+                del self.ports[key]
+                return None
+        return port
+
+    def due(self, port, timestamp):
+        # Whether the port, above threshold, is to be blocked now
+        if port.state != IDLE:
+            return False
+        if not self.block_window or timestamp - port.since > self.block_window:
+            return True
+        return self.repeated(port, timestamp)
+
+    def repeated(self, port, timestamp):
+        # Above threshold again within the duration of its last block
+        return port.released is not None and timestamp - port.released <= port.timeout
+
+    def blocking(self, key, rules, timestamp):
+        # The block rules of the port are being sent: returns their hard
+        # timeout, doubled for a repeat offender (0: permanent)
+        port = self.ports.get(key)
+        if port is None:
+            port = self.ports[key] = PortState()
+        if self.repeated(port, timestamp):
+            port.strikes += 1
+        else:
+            port.strikes = 0
+        port.state = BLOCKING
+        port.rules = rules
+        port.timeout = 0
+        if self.unlock_timeout is not None:
+            port.timeout = min(self.unlock_timeout * 2 ** port.strikes, self.max_timeout)
+        return port.timeout
+
+    def confirmed(self, key):
+        port = self.ports.get(key)
+        if port is not None and port.state == BLOCKING:
+            port.state = BLOCKED
+            port.left = len(port.rules)
+
+    def restore(self, key, rules, timeout):
+        # Block found on the switch or in a snapshot
+        port = self.ports.get(key)
+        if port is None:
+            port = self.ports[key] = PortState()
+        port.state = BLOCKED
+        port.rules = rules
+        port.left = len(rules)
+        port.timeout = timeout
+
+    def removed(self, key, timestamp):
+        # A block rule of the port left the switch: returns True once the
+        # last one has, the port being unblocked
+        port = self.ports.get(key)
+        if port is None or port.state != BLOCKED:
+            return False
+        port.left -= 1
+        if port.left > 0:
+            return False
+        self.release(port, timestamp)
+        return True
+
+    def release(self, port, timestamp):
+        port.state = IDLE
+        port.rules = []
+        port.left = 0
+        port.released = timestamp
+
+    def cancel_pending(self, dpid):
+        # Blocks of a disconnected switch will never be confirmed
+        for key, port in self.ports.items():
+            if key[0] == dpid and port.state == BLOCKING:
+                port.state = IDLE
+                port.rules = []
@@ -0,0 +1,146 @@
+import cProfile
+import io
+import os
+import pstats
+import signal
+import time
+
+from ryu.lib import hub
+
+import metrics
+
+# Longest profiling run of GET /profile, in seconds
+MAX_PROFILE_SECONDS = 300
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    from urlparse import parse_qs
+
+
+class HandlerProfiler(object):
+    # Opt-in instrumentation of a RyuApp.
+    #
+    # Once enabled, every event handler returned by the app's get_handlers
+    # (the lookup done by ryu's event loop for each event) is wrapped to record
+    # its run time in the sdn_handler_seconds histogram, the depth of the app's
+    # event queue is sampled every queue_interval seconds, and SIGUSR1 (or GET
+    # /profile?seconds=N on the metrics endpoint) starts/stops a cProfile run
+    # of the whole controller, dumped to profile_dir. Nothing is wrapped while
+    # disabled, so the handlers run at full speed.
+
+    def __init__(self, app, metrics, logger, queue_interval=1.0, report_interval=None,
+                 profile_dir='/tmp', top=25):
+        self.app = app
+        self.metrics = metrics
+        self.logger = logger
+        self.queue_interval = queue_interval
+        self.report_interval = report_interval  # seconds between two logged reports, None disables
+        self.profile_dir = profile_dir
+        self.top = top  # functions listed in a cProfile report
+        self.wrappers = {}  # handler name -> timed handler
+        self.max_queue_depth = 0
+        self.profile = None
+        self.enabled = False
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        # The instance attribute shadows RyuApp.get_handlers for the event loop
+        original = self.app.get_handlers
+        self.app.get_handlers = lambda ev, state=None: [self.wrap(handler) for handler in original(ev, state)]
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle_profile())
+        hub.spawn(self._sample_queue)
+        if self.report_interval:
+            hub.spawn(self._report_loop)
+
+    def routes(self):
+        # Extra routes of the metrics endpoint
+        return {'/profile': self.profile_request}
+
+    def wrap(self, handler):
+        name = handler.__name__
+        wrapper = self.wrappers.get(name)
+        if wrapper is None:
+            observe = self.metrics.observe
+            labels = (name,)
+
+            def wrapper(ev):
+                start = time.perf_counter()
+                try:
+                    return handler(ev)
+                finally:
+                    observe('sdn_handler_seconds', time.perf_counter() - start, labels)
+            self.wrappers[name] = wrapper
+        return wrapper
+
+    def _sample_queue(self):
+        while True:
+            depth = self.app.events.qsize()
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self.metrics.set('sdn_event_queue_depth', (), depth)
+            hub.sleep(self.queue_interval)
+
+    def _report_loop(self):
+        while True:
+            hub.sleep(self.report_interval)
+            self.logger.info('Handler costs:\n%s', self.report())
+
+    def report(self):
+        # Per-handler cost breakdown: calls, total, mean and approximate p99
+        # (upper bound of the bucket) of the recorded run times
+        buckets = self.metrics.buckets
+        series = self.metrics.values['sdn_handler_seconds']
+        rows = []
+        for (name,), (counts, total) in series.items():
+            calls = sum(counts)
+            p99 = None
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), counts):
+                cumulative += count
+                if cumulative >= 0.99 * calls:
+                    p99 = bound
+                    break
+            rows.append((total, name, calls, p99))
+        grand_total = sum(row[0] for row in rows) or 1
+        lines = ['%-34s %9s %10s %8s %10s %10s' % ('handler', 'calls', 'total s', 'share', 'mean us', 'p99 us')]
+        for total, name, calls, p99 in sorted(rows, reverse=True):
+            lines.append('%-34s %9d %10.3f %7.1f%% %10.1f %10s' % (
+                name, calls, total, 100.0 * total / grand_total, 1e6 * total / calls,
+                '>%.0f' % (1e6 * buckets[-1]) if p99 == float('inf') else '%.0f' % (1e6 * p99)))
+        lines.append('max event queue depth: %d' % self.max_queue_depth)
+        return '\n'.join(lines)
+
+    def toggle_profile(self):
+        # Start a cProfile run, or stop the current one and return its report
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            self.logger.info('Profiling started')
+            return None
+        self.profile.disable()
+        path = os.path.join(self.profile_dir, 'controller-%d.prof' % int(time.time()))
+        self.profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(self.top)
+        self.profile = None
+        self.logger.info('Profiling stopped, stats written to %s', path)
+        return out.getvalue()
+
+    def profile_request(self, environ):
+        # GET /profile?seconds=N: profile the controller for N seconds
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        try:
+            seconds = float(query.get('seconds', ['10'])[0])
+        except ValueError:
+            seconds = None
+        if seconds is None or not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise metrics.BadRequest('seconds must be a number above 0 and at most %d' % MAX_PROFILE_SECONDS)
+        if self.profile is not None:
+            return 'A profiling run is already in progress\n'
+        self.toggle_profile()
+        hub.sleep(seconds)
+        if self.profile is None:
+            return 'The profiling run was stopped by SIGUSR1\n'
+        return self.toggle_profile()
@@ -0,0 +1,64 @@
+import time
+
+# Meter used to rate-limit the table-miss (packet-in) flow on the switch
+PACKET_IN_METER_ID = 1
+
+
+class TokenBucket(object):
+    __slots__ = ('rate', 'burst', 'tokens', 'last')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate  # tokens added per second
+        self.burst = burst  # maximum number of tokens in the bucket
+        self.tokens = burst
+        self.last = now
+
+    def consume(self, now):
+        # Refill the bucket for the time elapsed since the last call, then
+        # take one token if available
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class PacketInLimiter(object):
+    # Token-bucket limiter of packet-in events keyed by (dpid, in_port).
+    # In shed mode the events exceeding the rate are dropped before any
+    # parsing (counted by the app in sdn_packet_in_shed_total), otherwise
+    # they are let through.
+
+    def __init__(self, rate=100, burst=200, shed=True):
+        self.rate = rate  # packet-ins per second allowed per (dpid, in_port)
+        self.burst = burst
+        self.shed = shed
+        self.buckets = {}
+
+    def allow(self, dpid, in_port):
+        now = time.monotonic()
+        key = (dpid, in_port)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket.consume(now) or not self.shed
+
+    def forget_datapath(self, dpid):
+        # Drop the buckets of a disconnected switch
+        for key in [key for key in self.buckets if key[0] == dpid]:
+            del self.buckets[key]
+
+
+def install_packet_in_meter(datapath, rate, burst, meter_id=PACKET_IN_METER_ID):
+    # Install an OpenFlow meter dropping packets above `rate` packets per
+    # second, so the switch itself limits the packet-ins sent to the controller
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+
+    bands = [parser.OFPMeterBandDrop(rate=rate, burst_size=burst)]
+    mod = parser.OFPMeterMod(datapath=datapath, command=ofproto.OFPMC_ADD,
+                             flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST,
+                             meter_id=meter_id, bands=bands)
+    datapath.send_msg(mod)
+    return meter_id
@@ -0,0 +1,94 @@
+# Duration reported by switches that do not support it (OpenFlow: all ones)
+DURATION_UNSUPPORTED = 0xffffffff
+
+
+def port_duration(stat):
+    # Port uptime reported by the switch in seconds, None if unsupported
+    if stat.duration_sec == DURATION_UNSUPPORTED:
+        return None
+    return stat.duration_sec + stat.duration_nsec / 1e9
+
+
+def counter_delta(new, old):
+    # Increase of a byte counter, across a 32 or 64 bit wrap; None when the
+    # counter went back for another reason (switch reboot, port flap). A
+    # decrease is only a wrap when the old value was within 1/16 of the
+    # counter range of its top and the new one within as much of zero: a
+    # reset of a counter half-way up would otherwise look like a huge
+    # increase.
+    if new >= old:
+        return new - old
+    for bits in (32, 64):
+        size = 1 << bits
+        margin = size >> 4
+        if size - margin <= old < size and new < margin:
+            return new + size - old
+    return None
+
+
+class PortRates(object):
+    # Throughput of every switch port from its byte counters.
+    #
+    # The interval between two samples is taken from the port duration
+    # reported by the switch, so that the queuing delay of the replies does
+    # not turn into rate spikes; the monotonic receive time of the reply is
+    # the fallback for switches without port durations. A duration or
+    # counter going back (without a wrap) restarts the port from the new
+    # sample. Samples closer than min_interval to the previous one are
+    # skipped (the next sample covers both). Rates are smoothed with an EWMA
+    # of weight alpha (1 disables smoothing).
+
+    def __init__(self, alpha=0.5, min_interval=0.1):
+        self.alpha = alpha
+        self.min_interval = min_interval  # seconds
+        # (dpid, port_no) -> [rx_bytes, tx_bytes, duration, received, rx_rate, tx_rate]
+        self.ports = {}
+
+    def update(self, dpid, port_no, rx_bytes, tx_bytes, duration, received):
+        # Returns (rx_rate, tx_rate) in bytes/s, None if there is no sample
+        key = (dpid, port_no)
+        prev = self.ports.get(key)
+        if prev is None:
+            self.ports[key] = [rx_bytes, tx_bytes, duration, received, None, None]
+            return None
+
+        if duration is not None and prev[2] is not None:
+            interval = duration - prev[2]
+        elif prev[3] is not None:
+            interval = received - prev[3]
+        else:
+            # Restored port of a switch without durations
+            interval = -1
+        rx_delta = counter_delta(rx_bytes, prev[0])
+        tx_delta = counter_delta(tx_bytes, prev[1])
+        if rx_delta is None or tx_delta is None or interval < 0:
+            # Counters or duration restarted
+            self.ports[key] = [rx_bytes, tx_bytes, duration, received, None, None]
+            return None
+        if interval < self.min_interval:
+            return None
+
+        rx_rate = rx_delta / interval
+        tx_rate = tx_delta / interval
+        if prev[4] is not None:
+            rx_rate = self.alpha * rx_rate + (1 - self.alpha) * prev[4]
+            tx_rate = self.alpha * tx_rate + (1 - self.alpha) * prev[5]
+        self.ports[key] = [rx_bytes, tx_bytes, duration, received, rx_rate, tx_rate]
+        return rx_rate, tx_rate
+
+    def get_state(self):
+        # Counters and durations of every port; receive times are only
+        # meaningful within one process and smoothed rates start over
+        return dict((key, [port[0], port[1], port[2]]) for key, port in self.ports.items())
+
+    def set_state(self, key, state):
+        rx_bytes, tx_bytes, duration = state
+        self.ports[key] = [rx_bytes, tx_bytes, duration, None, None, None]
+
+    def forget_port(self, dpid, port_no):
+        # The counters of the port start over (port added, deleted or down)
+        self.ports.pop((dpid, port_no), None)
+
+    def forget_datapath(self, dpid):
+        for key in [key for key in self.ports if key[0] == dpid]:
+            del self.ports[key]
@@ -0,0 +1,333 @@
+# Offline replay harness for the detection pipeline.
+#
+# Feeds recorded or synthetic port statistics into _port_stats_reply_handler
+# of a controller app through stub datapaths, on a simulated clock, without
+# Mininet or switches. FlowMods sent by the app are collected per barrier
+# batch and confirmed immediately, so block/unblock decisions are timed as
+# on a real switch. Block rules expire at their hard timeout with a
+# FlowRemoved message, as on the switch (the synthetic ports never go
+# silent, so idle timeouts are not simulated).
+#
+# The synthetic scenario mirrors the scripts in Scripts/: every port carries
+# 0.2 Mbit/s of UDP traffic (Script_Send.sh); the attacked ports follow
+# Script_DynamicSendDoS.sh (20 s normal traffic, a 10 Mbit/s flood for 60 s,
+# then normal traffic again), capped at the access link bandwidth.
+#
+# Reports stats replies handled per second, time to block, time to unblock
+# and false positives (blocks of ports that are not under attack). With
+# --profile the handlers run through the app's HandlerProfiler and the
+# per-handler cost breakdown and a cProfile report are printed as well.
+#
+# Usage:
+#   python replay.py --app dynamic_controller_traffic --switches 100 --ports 24
+#   python replay.py --save scenario.jsonl     # record the synthetic scenario
+#   python replay.py --load scenario.jsonl     # replay a recorded scenario
+#   python replay.py --profile                 # benchmark mode
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from ryu.ofproto import ofproto_v1_3, ofproto_v1_3_parser
+
+import flow_stats
+
+BENIGN_RATE = 0.2e6 / 8  # bytes/s, Script_Send.sh / Script_DynamicSendDoS.sh
+ATTACK_RATE = 10e6 / 8  # bytes/s, Script_DynamicSendDoS.sh
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubDatapath(object):
+    # Datapath recording the messages written by the FlowModQueue
+    def __init__(self, dpid):
+        self.id = dpid
+        self.ofproto = ofproto_v1_3
+        self.ofproto_parser = ofproto_v1_3_parser
+        self.xid = 0
+        self.messages = []  # messages of the batch being written
+        self.batches = []  # (barrier xid, [messages]) waiting for confirmation
+
+    def set_xid(self, msg):
+        self.xid += 1
+        msg.set_xid(self.xid)
+        if isinstance(msg, ofproto_v1_3_parser.OFPBarrierRequest):
+            self.batches.append((msg.xid, self.messages))
+            self.messages = []
+        else:
+            self.messages.append(msg)
+
+    def send(self, buf):
+        return True
+
+    def send_msg(self, msg):
+        if msg.xid is None:
+            self.set_xid(msg)
+
+
+class StubMessage(object):
+    def __init__(self, datapath, body=None, xid=None):
+        self.datapath = datapath
+        self.body = body
+        self.xid = xid
+
+
+class StubEvent(object):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def port_stats(port_no, rx_bytes, tx_bytes, duration):
+    return ofproto_v1_3_parser.OFPPortStats(
+        port_no=port_no, rx_packets=0, tx_packets=0, rx_bytes=rx_bytes,
+        tx_bytes=tx_bytes, rx_dropped=0, tx_dropped=0, rx_errors=0,
+        tx_errors=0, rx_frame_err=0, rx_over_err=0, rx_crc_err=0,
+        collisions=0, duration_sec=int(duration),
+        duration_nsec=int((duration % 1) * 1e9))
+
+
+def synthetic_scenario(switches, ports, attack_ratio, duration, interval, link_bw, seed):
+    # Yields the header (attack windows) and then one record per stats reply
+    rng = random.Random(seed)
+    attack_rate = min(ATTACK_RATE, link_bw * 1e6 / 8)
+    all_ports = [(dpid, port_no) for dpid in range(1, switches + 1) for port_no in range(1, ports + 1)]
+    attacked = rng.sample(all_ports, max(1, int(len(all_ports) * attack_ratio)))
+    windows = dict((key, (20.0, 80.0)) for key in attacked)
+    yield {'attacks': [[dpid, port_no, start, end] for (dpid, port_no), (start, end) in sorted(windows.items())]}
+
+    counters = dict((key, [0, 0]) for key in all_ports)
+    steps = int(duration / interval)
+    for step in range(steps + 1):
+        now = step * interval
+        for dpid in range(1, switches + 1):
+            ports_stats = []
+            for port_no in range(1, ports + 1):
+                key = (dpid, port_no)
+                counter = counters[key]
+                rate = max(0.0, rng.gauss(BENIGN_RATE, 0.2 * BENIGN_RATE))
+                window = windows.get(key)
+                if window is not None and window[0] <= now < window[1]:
+                    rate = attack_rate
+                counter[0] += int(rate * interval)  # received from the host
+                counter[1] += int(BENIGN_RATE * 0.05 * interval)  # replies
+                ports_stats.append([port_no, counter[0], counter[1]])
+            yield {'time': now, 'dpid': dpid, 'ports': ports_stats}
+
+
+def load_scenario(path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+
+class Replay(object):
+    def __init__(self, app_module, link_bw, config=None):
+        # config: option values overriding the presets of the app (sdn_config.py)
+        module = importlib.import_module(app_module)
+        app_class = module.SimpleSwitch13
+        if config:
+            app_class = type('SimpleSwitch13', (app_class,), {'CONFIG': dict(app_class.CONFIG, **config)})
+        self.clock = Clock()
+        self.app = app_class()
+        self.app.clock = self.clock
+        self.app.rate_clock = self.clock
+        # Evaluate the replies in the handler, so that decisions follow the
+        # simulated clock
+        self.app.stats_worker.threaded = False
+        # Static threshold at 80% of the link bandwidth, as computed by the
+        # app from link_bandwidth.json
+        self.app.initial_threshold = ((link_bw / 8) * 10**6) * 0.8
+        self.datapaths = {}
+        self.events = []  # (time, dpid, port_no, 'block' or 'unblock')
+        self.expiry = {}  # (dpid, match fields) -> (expiry time, block rule FlowMod)
+        self.replies = 0
+        self.handler_time = 0.0
+        self.handler = self.app._port_stats_reply_handler
+
+    def datapath(self, dpid):
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            datapath = self.datapaths[dpid] = StubDatapath(dpid)
+            self.app.datapaths[dpid] = datapath
+        return datapath
+
+    def reply(self, now, dpid, ports):
+        self.clock.now = now
+        datapath = self.datapath(dpid)
+        body = [port_stats(port_no, rx_bytes, tx_bytes, now) for port_no, rx_bytes, tx_bytes in ports]
+        ev = StubEvent(StubMessage(datapath, body))
+        start = time.perf_counter()
+        self.handler(ev)
+        self.handler_time += time.perf_counter() - start
+        self.replies += 1
+
+    def confirm(self):
+        # Write the queued FlowMods and answer their barriers
+        queue = self.app.flow_queue
+        for dpid in list(queue.pending):
+            queue.flush(dpid)
+        for datapath in self.datapaths.values():
+            batches, datapath.batches = datapath.batches, []
+            for xid, messages in batches:
+                for msg in messages:
+                    self._record(datapath, msg)
+                queue.barrier_reply(StubMessage(datapath, xid=xid))
+        self.expire()
+
+    def expire(self):
+        # FlowRemoved messages of the block rules past their hard timeout
+        for key, (expiry, msg) in list(self.expiry.items()):
+            if expiry > self.clock.now:
+                continue
+            del self.expiry[key]
+            datapath = self.datapaths[key[0]]
+            removed = ofproto_v1_3_parser.OFPFlowRemoved(
+                datapath, cookie=msg.cookie, priority=msg.priority,
+                reason=datapath.ofproto.OFPRR_HARD_TIMEOUT, table_id=msg.table_id,
+                hard_timeout=msg.hard_timeout, match=msg.match)
+            self.events.append((self.clock.now, key[0], msg.match.get('in_port'), 'unblock'))
+            self.app._flow_removed_handler(StubEvent(removed))
+
+    def _record(self, datapath, msg):
+        ofproto = datapath.ofproto
+        if not isinstance(msg, ofproto_v1_3_parser.OFPFlowMod) or msg.cookie != flow_stats.COOKIE_SECURITY:
+            return
+        port_no = msg.match.get('in_port')
+        key = (datapath.id, tuple(sorted(msg.match.items())))
+        if msg.command == ofproto.OFPFC_ADD:
+            self.events.append((self.clock.now, datapath.id, port_no, 'block'))
+            if msg.hard_timeout:
+                self.expiry[key] = (self.clock.now + msg.hard_timeout, msg)
+        elif msg.command in (ofproto.OFPFC_DELETE, ofproto.OFPFC_DELETE_STRICT):
+            self.events.append((self.clock.now, datapath.id, port_no, 'unblock'))
+            self.expiry.pop(key, None)
+
+    def run(self, records, save=None):
+        attacks = {}
+        last_time = None
+        for record in records:
+            if save is not None:
+                save.write(json.dumps(record) + '\n')
+            if 'attacks' in record:
+                attacks = dict(((dpid, port_no), (start, end)) for dpid, port_no, start, end in record['attacks'])
+                continue
+            if last_time is not None and record['time'] != last_time:
+                self.confirm()
+            last_time = record['time']
+            self.reply(record['time'], record['dpid'], record['ports'])
+        self.confirm()
+        return self.report(attacks)
+
+    def report(self, attacks):
+        first_block = {}
+        unblock_after = {}
+        false_positives = set()
+        for now, dpid, port_no, kind in self.events:
+            key = (dpid, port_no)
+            window = attacks.get(key)
+            if kind == 'block':
+                if window is None or now < window[0]:
+                    false_positives.add(key)
+                elif key not in first_block:
+                    first_block[key] = now - window[0]
+            elif window is not None and now >= window[1] and key not in unblock_after:
+                unblock_after[key] = now - window[1]
+
+        def summary(values):
+            if not values:
+                return 'n/a'
+            values = sorted(values)
+            return 'mean %.1f s, max %.1f s' % (sum(values) / len(values), values[-1])
+
+        return {
+            'stats replies': self.replies,
+            'stats replies/s': self.replies / self.handler_time if self.handler_time else 0,
+            'attacked ports': len(attacks),
+            'blocked attacked ports': len(first_block),
+            'time to block': summary(first_block.values()),
+            'time to unblock': summary(unblock_after.values()),
+            'false positives': len(false_positives),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay port statistics into a controller app')
+    parser.add_argument('--app', default='dynamic_controller_traffic', help='controller module to test')
+    parser.add_argument('--switches', type=int, default=100)
+    parser.add_argument('--ports', type=int, default=24, help='ports per switch')
+    parser.add_argument('--attack-ratio', type=float, default=0.01, help='fraction of ports under attack')
+    parser.add_argument('--duration', type=float, default=140, help='seconds of simulated traffic')
+    parser.add_argument('--interval', type=float, default=1, help='seconds between two stats replies')
+    parser.add_argument('--link-bw', type=float, default=3, help='link bandwidth in Mbit/s used for the threshold')
+    parser.add_argument('--bandwidth-file', help='link bandwidth file whose port thresholds replace --link-bw '
+                                                 'on its ports (default: none, --link-bw everywhere)')
+    parser.add_argument('--access-bw', type=float, default=6, help='bandwidth in Mbit/s of the attacker link')
+    parser.add_argument('--mitigation', help="mitigation mode of the app ('port', 'flow' or 'meter')")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--load', help='replay a recorded scenario (JSON lines)')
+    parser.add_argument('--save', help='record the synthetic scenario (JSON lines)')
+    parser.add_argument('--profile', action='store_true', help='print the per-handler cost breakdown')
+    parser.add_argument('--verbose', action='store_true', help='show the controller log')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    if args.load:
+        records = load_scenario(args.load)
+    else:
+        records = synthetic_scenario(args.switches, args.ports, args.attack_ratio, args.duration,
+                                     args.interval, args.access_bw, args.seed)
+    # No metrics endpoint or saved state for a replay, and the synthetic
+    # ports are independent hosts, not the topology of the bandwidth file
+    config = {'metrics_port': 0, 'state_file': '', 'profiling': args.profile, 'localization': False}
+    if args.mitigation:
+        config['mitigation'] = args.mitigation
+    # Without a bandwidth file every port gets the --link-bw threshold: the
+    # app is given an empty one rather than its default link_bandwidth.json
+    generated = None
+    if args.bandwidth_file:
+        config['bandwidth_file'] = args.bandwidth_file
+    else:
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'links': {}, 'ports': []}, f)
+        config['bandwidth_file'] = generated = f.name
+    save = open(args.save, 'w') if args.save else None
+    try:
+        replay = Replay(args.app, args.link_bw, config)
+        thresholds = replay.app.link_capacity.thresholds
+        print('threshold: %.0f B/s (--link-bw %s Mbit/s)%s'
+              % (replay.app.initial_threshold, args.link_bw,
+                 ', %d ports from %s' % (len(thresholds), args.bandwidth_file) if thresholds else ''))
+        profiler = replay.app.profiler
+        if profiler is not None:
+            replay.handler = profiler.wrap(replay.handler)
+            profiler.toggle_profile()
+        results = replay.run(records, save)
+    finally:
+        if save is not None:
+            save.close()
+        if generated is not None:
+            os.remove(generated)
+    for name, value in results.items():
+        print('%s: %s' % (name, value if not isinstance(value, float) else '%.0f' % value))
+    if profiler is not None:
+        profile = profiler.toggle_profile()
+        print('')
+        print(profiler.report())
+        print('')
+        print(profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Options of the SDN firewall app (sdn_firewall.py), in the [sdn] group of
+# the ryu configuration:
+#
+#   ryu-manager --config-file sdn.conf sdn_firewall.py
+#   ryu-manager --user-flags sdn_config.py sdn_firewall.py --sdn-detector ewma
+#
+# (--user-flags registers them as command line options). An option left
+# unset takes the preset of the app (SimpleSwitch13.CONFIG, see the wrapper
+# apps controller.py, controller_traffic.py and dynamic_controller_traffic.py)
+# and otherwise the default below.
+
+import json
+import os
+import types
+
+from ryu import cfg
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULTS = {
+    'monitoring': True,
+    'detector': 'static',
+    'detector_ports': '',
+    'mitigation': 'port',
+    'stats_policy': '',
+    'block_window': 5,
+    'unlock_timeout': 10,
+    'localization': True,
+    'bandwidth_file': os.environ.get('SDN_BANDWIDTH_FILE', os.path.join(APP_DIR, 'link_bandwidth.json')),
+    'state_file': os.path.join(APP_DIR, 'controller_state.jsonl'),
+    'acl_file': '',
+    'metrics_host': '127.0.0.1',
+    'metrics_port': 8000,
+    'sflow_host': '127.0.0.1',
+    'sflow_port': 0,
+    'sflow_file': '',
+    'profiling': False,
+    'profile_report_interval': 0,
+    'stats_worker': True,
+    'packet_in_meter': False,
+    'log_port_stats': False,
+}
+
+OPTS = [
+    cfg.BoolOpt('monitoring', help='poll the port and flow statistics and detect anomalous ports '
+                                   '(false: learning switch only)'),
+    cfg.StrOpt('detector', help="anomaly detector of the ports: 'static', 'ewma', 'cusum', 'mad' "
+                                "or 'mean_std' (mean + 2 stddev of the throughput history, NumPy)"),
+    cfg.StrOpt('detector_ports', help='detectors of specific ports, over detector: JSON object, or file '
+                                      'holding one, mapping "dpid:port_no" to a detector name or to '
+                                      '{"detector": name, parameters...}, e.g. {"1:2": {"detector": '
+                                      '"ewma", "k": 4}}'),
+    cfg.StrOpt('mitigation', help="mitigation of an anomalous port: 'port', 'flow' or 'meter'"),
+    cfg.StrOpt('stats_policy', help="flow statistics requested with each switch poll: 'port' (none), "
+                                    "'aggregate', 'security' (traffic dropped by the block rules) or "
+                                    "'talkers' (per-MAC rates) ('': talkers with flow mitigation, "
+                                    "aggregate otherwise)"),
+    cfg.IntOpt('block_window', help='seconds a port must exceed its threshold to be blocked (0: at once)'),
+    cfg.IntOpt('unlock_timeout', help='seconds the block rules of a port stay on the switch, doubled for '
+                                      'repeat offenders (0: blocks are permanent)'),
+    cfg.BoolOpt('localization', help='mitigate alerts of inter-switch ports at the ingress edge port '
+                                     'upstream (false: every port exceeding its threshold is mitigated)'),
+    cfg.StrOpt('bandwidth_file', help='link bandwidth file exported by the topology'),
+    cfg.StrOpt('acl_file', help="static firewall policy (see acl_policy.py, '' disables it)"),
+    cfg.StrOpt('state_file', help="controller state saved for warm restarts ('' disables it)"),
+    cfg.StrOpt('metrics_host', help='address of the metrics endpoint'),
+    cfg.IntOpt('metrics_port', help='port of the metrics endpoint (0 disables it)'),
+    cfg.StrOpt('sflow_host', help='address of the sFlow collector'),
+    cfg.IntOpt('sflow_port', help='UDP port of the sFlow collector, whose samples replace the port '
+                                  'statistics polling for detection (0 disables it)'),
+    cfg.StrOpt('sflow_file', help='replay the sFlow datagrams recorded in this file instead of listening '
+                                  "(see sflow_collector.py, '' disables it)"),
+    cfg.BoolOpt('profiling', help='time the event handlers and allow cProfile runs'),
+    cfg.IntOpt('profile_report_interval', help='seconds between two logged handler reports (0 disables them)'),
+    cfg.BoolOpt('stats_worker', help='analyse the port statistics on a worker thread'),
+    cfg.BoolOpt('packet_in_meter', help='rate-limit packet-ins with a meter on the table-miss flow'),
+    cfg.BoolOpt('log_port_stats', help='log the throughput of every port'),
+]
+
+
+def register(conf=cfg.CONF):
+    try:
+        conf.register_cli_opts(OPTS, group='sdn')
+    except cfg.ArgsAlreadyParsedError:
+        # Imported by the app after the command line was parsed
+        conf.register_opts(OPTS, group='sdn')
+
+
+def load(presets=None, conf=cfg.CONF):
+    # Option values: ryu configuration, else presets, else DEFAULTS
+    register(conf)
+    values = dict(DEFAULTS)
+    values.update(presets or {})
+    group = conf.sdn
+    for name in DEFAULTS:
+        value = getattr(group, name)
+        if value is not None:
+            values[name] = value
+    values['detector_ports'] = parse_detector_ports(values['detector_ports'])
+    return types.SimpleNamespace(**values)
+
+
+def parse_detector_ports(text):
+    # {(dpid, port_no): (detector name, keyword arguments)} of the
+    # detector_ports option
+    if not text:
+        return {}
+    if not text.lstrip().startswith('{'):
+        with open(text) as f:
+            text = f.read()
+    ports = {}
+    for key, value in json.loads(text).items():
+        dpid, _, port_no = key.partition(':')
+        params = {}
+        if isinstance(value, dict):
+            params = dict(value)
+            value = params.pop('detector', None)
+        if not isinstance(value, str):
+            raise ValueError('No detector name for port %s' % key)
+        ports[(int(dpid), int(port_no))] = (value, params)
+    return ports
+
+
+register()
@@ -0,0 +1,1166 @@
+# SDN firewall: learning switch with port statistics monitoring, anomaly
+# detection and mitigation of the anomalous ports, configured by the [sdn]
+# options of sdn_config.py. The modules of the optional components (the
+# statistics monitoring and its detectors, the sFlow collector, NumPy for
+# detector 'mean_std', the firewall policy and the profiler) are only
+# imported when enabled.
+#
+#   ryu-manager sdn_firewall.py
+#   ryu-manager --user-flags sdn_config.py sdn_firewall.py --sdn-mitigation flow
+
+import struct
+import time
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, DEAD_DISPATCHER
+from ryu.controller.handler import set_ev_cls
+from ryu.ofproto import ofproto_v1_3
+from ryu.lib.packet import packet, ethernet, ether_types
+from ryu.lib import hub
+import fast_packet
+import rate_limiter
+import flow_queue
+import flow_stats
+import link_capacity
+import flow_mitigation
+import meter_policy
+import metrics
+import state_store
+import flow_table
+import mac_table
+import shard
+import topology_graph
+import pipeline
+import port_state
+import sdn_config
+
+class SimpleSwitch13(app_manager.RyuApp):
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _EVENTS = [mac_table.EventPortSecurityViolation]
+
+    # Option values of this app, overriding sdn_config.DEFAULTS (the
+    # wrapper apps set their own)
+    CONFIG = {}
+
+    def __init__(self, *args, **kwargs):
+        super(SimpleSwitch13, self).__init__(*args, **kwargs)
+        config = sdn_config.load(self.CONFIG)
+        # Clock of the statistics samples (replaced by the replay harness)
+        self.clock = time.time
+        # Learned MAC addresses (see mac_table.py), aged out after max_age
+        # seconds; a port learns at most max_per_port addresses, frames from
+        # further addresses are dropped and an EventPortSecurityViolation is sent
+        self.mac_to_port = mac_table.MacTable(max_age=300, max_per_port=256, max_per_switch=8192,
+                                              on_remove=self._mac_removed)
+
+        # Decode packet-ins with the fast Ethernet header decoder; set to False
+        # to always use the full ryu packet parser
+        self.fast_parse = True
+        self.packet_in_log = fast_packet.PacketInLogSampler(self.logger)
+
+        # Token-bucket limit of packet-ins per (dpid, in_port); in shed mode the
+        # excess events are dropped before parsing
+        self.packet_in_limiter = rate_limiter.PacketInLimiter(rate=100, burst=200, shed=True)
+
+        # Also rate-limit packet-ins on the switch with an OpenFlow meter on the
+        # table-miss flow (requires meter support in the switch)
+        self.packet_in_meter = config.packet_in_meter
+        self.packet_in_meter_rate = 1000  # packets per second per switch
+
+        # Sharded deployment (see shard.py): this worker only handles the
+        # switches of its shard and shares its blocked ports with the other
+        # workers. A single worker owns every switch.
+        self.shard = shard.Shard.from_env(self.logger)
+        self.shard.start(hub.spawn)
+
+        # Controller metrics, served in Prometheus format on
+        # http://metrics_host:metrics_port/metrics (None disables the endpoint),
+        # one port per shard worker
+        self.metrics = metrics.Metrics()
+        self.metrics_host = config.metrics_host
+        self.metrics_port = config.metrics_port + self.shard.index if config.metrics_port else None
+
+        # Opt-in profiling (see profiling.py): run time of every event handler,
+        # event queue depth, cProfile runs on SIGUSR1 or GET /profile?seconds=N
+        # and a per-handler cost breakdown logged every profile_report_interval
+        # seconds (None disables it)
+        self.profiling = config.profiling
+        self.profile_report_interval = config.profile_report_interval or None
+        self.profiler = None
+        routes = {}
+        if self.profiling:
+            import profiling
+            self.profiler = profiling.HandlerProfiler(self, self.metrics, self.logger,
+                                                      report_interval=self.profile_report_interval)
+            self.profiler.enable()
+            routes = self.profiler.routes()
+
+        if self.metrics_port is not None:
+            hub.spawn(metrics.MetricsServer(self.metrics, self.metrics_host, self.metrics_port,
+                                            self.logger, routes).serve)
+        # Also log the throughput of every port (formatting costs CPU on large networks)
+        self.log_port_stats = config.log_port_stats
+
+        # Timeouts and table occupancy of the learned L2 flows: past
+        # coarse_ratio of capacity new flows match the destination only
+        self.flow_table = flow_table.FlowTable(idle_timeout=30, hard_timeout=300,
+                                               capacity=10000, coarse_ratio=0.8)
+
+        # FlowMods are batched per datapath and confirmed with barriers
+        self.flow_queue = flow_queue.FlowModQueue(self.logger, metrics=self.metrics)
+
+        self.datapaths = {}
+        self.security_priority = 100
+
+        # Static firewall policy (see acl_policy.py), compiled into entries
+        # between the L2 flows and the block rules on a thread of its own;
+        # the entries of a switch are read back when it connects and then
+        # changed by diffs, also when the file changes (None disables it)
+        self.acl = None
+        if config.acl_file:
+            import acl_policy
+            self.acl = acl_policy.AclPolicy(config.acl_file, base_priority=2,
+                                            max_priority=self.security_priority - 1, logger=self.logger)
+
+        # Mitigation of an anomalous port: 'port' drops everything received on
+        # the port, 'flow' installs narrow drop rules for the offending sources
+        # found in the flow stats (stats_policy 'talkers') and in a sample of
+        # the packet-ins, falling back to the whole port, 'meter' first caps
+        # the port at its fair share with a meter and drops it only if it
+        # keeps exceeding the threshold for escalate_window seconds
+        self.mitigation_mode = config.mitigation
+        self.source_sampler = flow_mitigation.SourceSampler(every=10)
+        self.flow_mitigator = flow_mitigation.FlowMitigator(max_rules=16)
+
+        # Meter of each metered port (entry of the metering table)
+        self.port_meters = {}
+        self.meter_allocator = meter_policy.MeterAllocator()
+        # Rate of the meter, relative to the static threshold of the port
+        self.fair_share_ratio = 0.5
+        # Time a metered port must stay above threshold to be dropped
+        self.escalate_window = 10  # seconds
+
+        # Ports whose meter FlowMods have been sent but not yet confirmed by a
+        # barrier reply
+        self.pending_ports = set()
+
+        # Timeout for unlocking a port (None: blocked ports stay blocked)
+        self.unlock_timeout = config.unlock_timeout or None  # seconds
+
+        # Time that throughput must stay above threshold to trigger block
+        # (0: block at the first sample above threshold)
+        self.block_window = config.block_window  # seconds
+
+        # Block state of the anomalous ports; the block rules expire on the
+        # switch after unlock_timeout seconds, doubled for repeat offenders
+        self.port_states = port_state.PortStates(self.block_window, self.unlock_timeout)
+
+        # Timestamp for the last log
+        self.last_log_time = self.clock()
+
+        # Capacity and static threshold of every (dpid, port_no), loaded from the
+        # link bandwidth file exported by the topology and reloaded when it changes
+        self.link_capacity = link_capacity.LinkCapacity(config.bandwidth_file, logger=self.logger)
+        self.link_capacity.load()
+        # Switch graph from the link bandwidth file (and LLDP, see
+        # lldp_firewall.py) telling edge ports from inter-switch links, for
+        # the MAC limit of the ports and the localization of the alerts
+        self.topology = topology_graph.TopologyGraph()
+        self.topology.load_ports(self.link_capacity.ports)
+
+        # Statistics polling and anomaly detection; without them the app is a
+        # learning switch. Their modules are only imported when enabled.
+        self.monitoring = config.monitoring
+        self.throughput_history = None
+        self.stats_worker = None
+        self.sflow = None
+        if self.monitoring:
+            self._start_monitoring(config)
+
+        # Warm restart: learned MACs, blocked and metered ports, port counters
+        # and detector baselines are saved to state_path (None disables it)
+        # every snapshot_interval seconds and restored on startup; each switch
+        # is then reconciled with its flow table when it connects
+        self.state_path = config.state_file or None
+        if self.state_path is not None and self.shard.sharded:
+            # Every worker saves the state of its own switches
+            self.state_path += '.%d' % self.shard.index
+        self.snapshot_interval = 30  # seconds
+        self.last_snapshot = self.clock()
+        self.state_store = None
+        if self.state_path is not None:
+            self.state_store = state_store.StateStore(self.state_path, logger=self.logger)
+            self._restore_state()
+
+        # xid of the flow table request of each connecting switch and the
+        # parts of its reply received so far
+        self.reconcile_xids = {}
+        self.reconcile_flows = {}
+
+        if self.acl is not None:
+            # Switch names of the policy are those of the link bandwidth file
+            self.acl.load(self._switch_names())
+            hub.spawn(self._acl_loop)
+
+        self.monitor_thread = hub.spawn(self._monitor)
+
+    def _start_monitoring(self, config):
+        # Port throughput from the byte counters (see rates.py), on the
+        # port durations reported by the switches or, when unsupported, on
+        # rate_clock; smoothed with an EWMA of weight alpha
+        import detectors
+        import rates
+        import stats_scheduler
+        import stats_worker
+        self.rate_clock = time.monotonic
+        self.port_rates = rates.PortRates(alpha=0.5, min_interval=0.1)
+        self.port_throughput = {}
+
+        # Initialize dynamic threshold based on bandwidth
+        self.initial_threshold = self.calculate_initial_threshold()
+
+        # Topology-aware localization: switch graph from the link bandwidth
+        # file (and LLDP, see lldp_firewall.py) telling edge ports from
+        # inter-switch links. An alert on a trunk port or on the edge port of
+        # the victim is left to the ingress edge ports upstream; the port
+        # itself is only mitigated when no ingress port has exceeded its
+        # threshold localization_grace seconds after its block window
+        self.localization = config.localization
+        self.localization_grace = 5  # seconds
+        # Edge ports receiving traffic above threshold from their host
+        self.ingress_alerts = set()
+        # Ports whose alert has been left to an ingress port
+        self.localized_ports = set()
+
+        # Jittered, load-adaptive scheduling of the port stats requests: every
+        # switch is polled each max_interval seconds, ports near their
+        # threshold or blocked down to each min_interval seconds
+        # (with sFlow only the flow statistics are polled)
+        sflow = bool(config.sflow_port or config.sflow_file)
+        self.stats_scheduler = stats_scheduler.StatsScheduler(min_interval=1, max_interval=5,
+                                                              port_stats=not sflow, logger=self.logger)
+
+        # Flow statistics requested with each full switch poll (see
+        # flow_stats.STATS_POLICIES) and their consumer; flow mitigation
+        # finds the offending sources in the per-MAC rates
+        self.stats_policy = config.stats_policy or (
+            flow_stats.STATS_TALKERS if self.mitigation_mode == flow_mitigation.MITIGATE_FLOW
+            else flow_stats.STATS_AGGREGATE)
+        if self.stats_policy not in flow_stats.STATS_POLICIES:
+            raise ValueError('Unknown stats policy %s' % self.stats_policy)
+        self.flow_stats = flow_stats.FlowStatsTracker()
+
+        # Anomaly detector of every port ('static', 'ewma', 'cusum' or 'mad',
+        # see detectors.py; detector_ports gives specific ports their own
+        # detector and parameters) or 'mean_std': mean + 2 * stddev of the last 100
+        # throughput samples of the port, kept in NumPy arrays
+        default = config.detector
+        if config.detector == 'mean_std':
+            import throughput_store
+            self.throughput_history = throughput_store.ThroughputStore(window=100)
+            default = None
+        ports = config.detector_ports
+        self.detectors = detectors.DetectorBank(
+            default=default, overrides=dict((key, name) for key, (name, _) in ports.items()),
+            port_params=dict((key, params) for key, (_, params) in ports.items()))
+
+        # Port stats replies are only snapshotted by the handler: rates and
+        # detectors run on a worker thread (see stats_worker.py), whose
+        # decisions are applied on the event loop. port_rates,
+        # port_throughput, throughput_history and detectors belong to the
+        # worker: once it runs, the event loop only reaches them through
+        # stats_worker.call (_restore_state fills them before).
+        self.stats_worker = stats_worker.StatsWorker(self._evaluate_port_stats, self.check_port_threshold,
+                                                     threaded=config.stats_worker, batch=64, logger=self.logger)
+        hub.spawn(self.stats_worker.dispatch_loop, hub.sleep)
+
+        # Push-based telemetry: with an sFlow collector on sflow_host:sflow_port
+        # (or a record replayed from sflow_file) the port rates estimated from
+        # the samples of the switches feed the detectors every 0.5 s instead of
+        # the port stats replies; switches are only polled every max_interval
+        # seconds for their flow statistics. The sampled sources of a port are
+        # used by the flow mitigation.
+        if sflow:
+            import sflow_collector
+            self.sflow = sflow_collector.SFlowCollector(
+                sflow_collector.load_ifindex(self.link_capacity.ports), self._sflow_rates,
+                config.sflow_host, config.sflow_port, interval=0.5, logger=self.logger)
+            if config.sflow_file:
+                hub.spawn(self.sflow.replay, config.sflow_file, hub.sleep)
+            else:
+                hub.spawn(self.sflow.serve, hub.sleep, lambda: self.clock())
+
+    def _switch_names(self):
+        return dict((entry['switch'], int(entry['dpid'])) for entry in self.link_capacity.ports)
+
+    def calculate_initial_threshold(self):
+        # Threshold of the ports missing from the link bandwidth file: the lowest
+        # port threshold of the topology, 0.75MBps if the file could not be loaded
+        return self.link_capacity.min_threshold(750000)
+
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        datapath = ev.msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.datapaths[datapath.id] = datapath
+
+        # The role goes first: a switch of another worker is only programmed
+        # by its owner, this worker being its slave controller
+        self.shard.request_role(datapath)
+        if not self.shard.owns(datapath.id):
+            return
+
+        # Security and metering tables go on to the next table (see
+        # pipeline.py), the forwarding table misses to the controller
+        for mod in pipeline.table_miss_mods(datapath):
+            self.flow_queue.send(datapath, mod)
+        match = parser.OFPMatch()
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
+                                          ofproto.OFPCML_NO_BUFFER)]
+        meter_id = None
+        if self.packet_in_meter:
+            meter_id = rate_limiter.install_packet_in_meter(
+                datapath, self.packet_in_meter_rate, self.packet_in_meter_rate)
+        self.add_flow(datapath, 0, match, actions, meter_id=meter_id, table_id=pipeline.TABLE_L2)
+        if self.acl is not None:
+            # Compiled while the flow table of the switch is read back, and
+            # installed by _acl_loop if it is not ready for the reconciliation
+            self.acl.prepare(datapath.id)
+
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None,
+                 meter_id=None, callback=None, cookie=0, idle_timeout=0,
+                 hard_timeout=0, flags=0, table_id=pipeline.TABLE_SECURITY,
+                 goto_table=None):
+        # Entry of table_id applying actions and continuing to goto_table
+        # (None: the pipeline ends here; no actions and no goto drops)
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        inst = []
+        if actions or goto_table is None:
+            inst.append(parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                                     actions))
+        if meter_id is not None:
+            inst.insert(0, parser.OFPInstructionMeter(meter_id,
+                                                      ofproto.OFPIT_METER))
+        if goto_table is not None:
+            inst.append(parser.OFPInstructionGotoTable(goto_table))
+        if buffer_id:
+            mod = parser.OFPFlowMod(datapath=datapath, buffer_id=buffer_id,
+                                    cookie=cookie, table_id=table_id, priority=priority,
+                                    idle_timeout=idle_timeout, hard_timeout=hard_timeout,
+                                    flags=flags, match=match, instructions=inst)
+        else:
+            mod = parser.OFPFlowMod(datapath=datapath, cookie=cookie, table_id=table_id,
+                                    priority=priority, idle_timeout=idle_timeout,
+                                    hard_timeout=hard_timeout, flags=flags,
+                                    match=match, instructions=inst)
+        self.flow_queue.send(datapath, mod, callback)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def _barrier_reply_handler(self, ev):
+        self.flow_queue.barrier_reply(ev.msg)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        if msg.cookie == flow_stats.COOKIE_SECURITY:
+            # A block rule expired (or was deleted) on the switch
+            key = (msg.datapath.id, msg.match.get('in_port'))
+            if self.port_states.removed(key, self.clock()):
+                self._port_unblocked(key[0], key[1])
+            return
+        if msg.cookie != flow_stats.COOKIE_L2:
+            return
+        datapath = msg.datapath
+        dpid = datapath.id
+        key = flow_table.flow_key(msg.match)
+        in_port, _, src = key
+        if self.flow_table.removed(dpid, key) and msg.reason != datapath.ofproto.OFPRR_DELETE:
+            # The source has been idle on the switch: forget its port, it is
+            # learned again with its next frame
+            self.mac_to_port.forget(dpid, fast_packet.mac_to_int(src), in_port)
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    @metrics.timed('sdn_packet_in_handler_seconds')
+    def _packet_in_handler(self, ev):
+        if ev.msg.msg_len < ev.msg.total_len:
+            self.logger.debug("packet truncated: only %s of %s bytes",
+                              ev.msg.msg_len, ev.msg.total_len)
+        msg = ev.msg
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        in_port = msg.match['in_port']
+
+        self.metrics.inc('sdn_packet_in_total', (datapath.id,))
+        if not self.packet_in_limiter.allow(datapath.id, in_port):
+            self.metrics.inc('sdn_packet_in_shed_total', (datapath.id,))
+            return
+
+        header = None
+        if self.fast_parse:
+            header = fast_packet.parse_eth_header(msg.data)
+        if header is None:
+            # Fall back to the full ryu parser
+            pkt = packet.Packet(msg.data)
+            eth = pkt.get_protocols(ethernet.ethernet)[0]
+            header = (fast_packet.mac_to_int(eth.dst), fast_packet.mac_to_int(eth.src), eth.ethertype)
+        dst, src, ethertype = header
+
+        if ethertype == ether_types.ETH_TYPE_LLDP:
+            return
+
+        dpid = datapath.id
+
+        self.packet_in_log.log(dpid, src, dst, in_port)
+
+        # Inter-switch links carry the addresses of many hosts: the MAC limit
+        # only applies to edge ports
+        learned = self.mac_to_port.learn(dpid, src, in_port, self.clock(),
+                                         limited=self.topology.is_edge(dpid, in_port))
+        if learned is mac_table.VIOLATION or learned is mac_table.REJECTED:
+            # Port over its MAC limit: drop frames from new addresses
+            if learned is mac_table.VIOLATION:
+                self._port_security_violation(dpid, in_port, src)
+            return
+        if learned is not mac_table.REFRESHED and self.state_store is not None:
+            self.state_store.put('mac', (dpid, src), in_port)
+
+        if self.mitigation_mode == flow_mitigation.MITIGATE_FLOW:
+            self.source_sampler.sample(dpid, in_port, src, msg.data)
+
+        # Broadcast frames are always flooded, skip the table lookup
+        out_port = None
+        if dst != fast_packet.BROADCAST:
+            out_port = self.mac_to_port.lookup(dpid, dst)
+        if out_port is None:
+            out_port = ofproto.OFPP_FLOOD
+
+        actions = [parser.OFPActionOutput(out_port)]
+
+        if out_port != ofproto.OFPP_FLOOD:
+            if self.flow_table.coarse(dpid):
+                # Flow table nearly full: one flow per destination
+                match = parser.OFPMatch(eth_dst=fast_packet.int_to_mac(dst))
+            else:
+                match = parser.OFPMatch(in_port=in_port, eth_dst=fast_packet.int_to_mac(dst),
+                                        eth_src=fast_packet.int_to_mac(src))
+            self.flow_table.installed(dpid, flow_table.flow_key(match))
+            timeouts = dict(idle_timeout=self.flow_table.idle_timeout,
+                            hard_timeout=self.flow_table.hard_timeout,
+                            flags=ofproto.OFPFF_SEND_FLOW_REM)
+            if msg.buffer_id != ofproto.OFP_NO_BUFFER:
+                self.add_flow(datapath, 1, match, actions, msg.buffer_id, cookie=flow_stats.COOKIE_L2,
+                              table_id=pipeline.TABLE_L2, **timeouts)
+                return
+            else:
+                self.add_flow(datapath, 1, match, actions, cookie=flow_stats.COOKIE_L2,
+                              table_id=pipeline.TABLE_L2, **timeouts)
+        data = None
+        if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+            data = msg.data
+
+        out = parser.OFPPacketOut(datapath=datapath, buffer_id=msg.buffer_id,
+                                  in_port=in_port, actions=actions, data=data)
+        # After the flow installed above, so that the next packets of the
+        # flow match it instead of coming back as packet-ins
+        self.flow_queue.send_after(datapath, out)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, MAIN_DISPATCHER)
+    def _error_msg_handler(self, ev):
+        # The data of an error starts with the request that caused it: a
+        # failed port stats request is not outstanding any more
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        if not self.monitoring or len(msg.data) < ofproto.OFP_HEADER_SIZE + 2:
+            return
+        _, msg_type, _, _ = struct.unpack_from(ofproto.OFP_HEADER_PACK_STR, msg.data)
+        (stats_type,) = struct.unpack_from('!H', msg.data, ofproto.OFP_HEADER_SIZE)
+        if msg_type == ofproto.OFPT_MULTIPART_REQUEST and stats_type == ofproto.OFPMP_PORT_STATS:
+            self.logger.warning('Port stats request to switch %s failed: type %s code %s',
+                                msg.datapath.id, msg.type, msg.code)
+            self.stats_scheduler.request_failed(msg.datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    def _port_status_handler(self, ev):
+        # A port added, deleted or going down may restart its counters: its
+        # next sample starts a new rate
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        if not self.monitoring:
+            return
+        if msg.reason != ofproto.OFPPR_MODIFY or msg.desc.state & ofproto.OFPPS_LINK_DOWN:
+            self.stats_worker.call(self.port_rates.forget_port, msg.datapath.id, msg.desc.port_no)
+        if msg.reason == ofproto.OFPPR_DELETE and self.sflow is not None:
+            self.sflow.forget_port(msg.datapath.id, msg.desc.port_no)
+
+    @set_ev_cls(ofp_event.EventOFPRoleReply, MAIN_DISPATCHER)
+    def _role_reply_handler(self, ev):
+        msg = ev.msg
+        self.logger.info('Role %s on switch %s', msg.role, msg.datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange,
+                [MAIN_DISPATCHER, DEAD_DISPATCHER])
+    def _state_change_handler(self, ev):
+        datapath = ev.datapath
+        if ev.state == MAIN_DISPATCHER:
+            if datapath.id not in self.datapaths:
+                self.logger.info('register datapath: %016x', datapath.id)
+                self.datapaths[datapath.id] = datapath
+            if not self.shard.owns(datapath.id):
+                # Handled by another worker, this one is a slave controller
+                return
+            if self.monitoring:
+                self.stats_scheduler.add_datapath(datapath.id, self.clock())
+            # Read back the flows the switch kept across a controller restart
+            self.reconcile_xids[datapath.id] = state_store.request_flow_table(datapath)
+        elif ev.state == DEAD_DISPATCHER:
+            if datapath.id in self.datapaths:
+                self.logger.info('unregister datapath: %016x', datapath.id)
+                del self.datapaths[datapath.id]
+                self.packet_in_limiter.forget_datapath(datapath.id)
+                self.flow_queue.forget_datapath(datapath.id)
+                self.flow_table.forget_datapath(datapath.id)
+                self.mac_to_port.forget_datapath(datapath.id)
+                self.topology.forget_datapath(datapath.id)
+                self.metrics.forget_datapath(datapath.id)
+                if self.monitoring:
+                    self.stats_scheduler.remove_datapath(datapath.id)
+                    self.flow_stats.forget_datapath(datapath.id)
+                    for key in [key for key in self.ingress_alerts if key[0] == datapath.id]:
+                        self.ingress_alerts.discard(key)
+                        self.shard.alert(key[0], key[1], False)
+                    self.localized_ports = set(key for key in self.localized_ports if key[0] != datapath.id)
+                    self.stats_worker.call(self._forget_worker_state, datapath.id)
+                self.source_sampler.forget_datapath(datapath.id)
+                self.flow_mitigator.forget_datapath(datapath.id)
+                if self.sflow is not None:
+                    self.sflow.forget_datapath(datapath.id)
+                # Meters are kept: the switch may keep them too, and they are
+                # checked against its metering table when it reconnects
+                # Unconfirmed block and meter requests will never be confirmed
+                self.pending_ports = set(key for key in self.pending_ports if key[0] != datapath.id)
+                self.port_states.cancel_pending(datapath.id)
+                self.reconcile_xids.pop(datapath.id, None)
+                self.reconcile_flows.pop(datapath.id, None)
+                if self.acl is not None:
+                    self.acl.forget_datapath(datapath.id)
+
+    def _monitor(self):
+        while True:
+            # Apply changes of the link bandwidth file
+            if self.link_capacity.refresh(self.clock()):
+                self.topology.load_ports(self.link_capacity.ports)
+                if self.monitoring:
+                    self.initial_threshold = self.calculate_initial_threshold()
+                    if self.sflow is not None:
+                        import sflow_collector
+                        self.sflow.ports = sflow_collector.load_ifindex(self.link_capacity.ports)
+            if self.monitoring:
+                for dpid, port_no in self.stats_scheduler.due(self.clock()):
+                    datapath = self.datapaths.get(dpid)
+                    if datapath is not None:
+                        self._request_stats(datapath, port_no)
+                self.metrics.set('sdn_stats_worker_backlog', (), self.stats_worker.backlog())
+                if self.sflow is not None:
+                    self.metrics.set('sdn_sflow_datagrams_total', (), self.sflow.datagrams)
+                    self.metrics.set('sdn_sflow_malformed_total', (), self.sflow.errors)
+            self.mac_to_port.expire(self.clock())
+            if self.state_store is not None and self.clock() - self.last_snapshot >= self.snapshot_interval:
+                self._snapshot_state()
+            # Sleep until the next scheduled request
+            delay = self.stats_scheduler.next_due(self.clock()) if self.monitoring else 1
+            hub.sleep(min(max(delay, 0.05), 1))
+
+    def _acl_loop(self):
+        while True:
+            self.acl.refresh(self.clock(), self._switch_names())
+            if self.acl.poll():
+                # New entries compiled: switches whose entries are known
+                # (their flow table was read) are brought up to date
+                for dpid in list(self.acl.installed):
+                    datapath = self.datapaths.get(dpid)
+                    if datapath is not None:
+                        self._apply_acl(datapath)
+            hub.sleep(0.1)
+
+    def _snapshot_state(self):
+        # Port counters and detector baselines change with every reply: the
+        # stats worker copies them all, saved when the copy comes back;
+        # MACs, blocks and meters were recorded as they changed
+        self.last_snapshot = self.clock()
+        if self.monitoring:
+            self.stats_worker.call(self._worker_state, then=self._save_snapshot)
+        else:
+            self._save_snapshot({})
+
+    def _worker_state(self):
+        # Runs on the stats worker: {kind: {key: value}} to save
+        state = {'port_counters': self.port_rates.get_state(),
+                 'detector': dict((key, [name, detector_state])
+                                  for key, (name, detector_state) in self.detectors.states().items())}
+        if self.throughput_history is not None:
+            state['history'] = self.throughput_history.history()
+        return state
+
+    def _save_snapshot(self, state):
+        store = self.state_store
+        for kind, values in state.items():
+            for key, value in values.items():
+                store.put(kind, key, value)
+        store.flush()
+
+    def _forget_worker_state(self, dpid):
+        # Runs on the stats worker
+        self.detectors.forget_datapath(dpid)
+        self.port_rates.forget_datapath(dpid)
+        self.port_throughput.pop(dpid, None)
+        if self.throughput_history is not None:
+            self.throughput_history.forget_datapath(dpid)
+
+    def _restore_state(self):
+        state = self.state_store.load()
+        blocked = 0
+        for (dpid, mac), port_no in state.get('mac', {}).items():
+            self.mac_to_port.learn(dpid, mac, port_no, self.clock(), limited=self.topology.is_edge(dpid, port_no))
+        for key, value in state.get('blocked', {}).items():
+            # [since, rules, hard timeout]; the timeout was not saved by older
+            # versions, whose blocks were lifted by the controller
+            timeout = value[2] if len(value) > 2 else self.unlock_timeout or 0
+            self.port_states.restore(key, [state_store.match_fields(fields) for fields in value[1]], timeout)
+            blocked += 1
+        now = self.clock()
+        for (dpid, port_no), (meter_id, rate_kbps) in state.get('meter', {}).items():
+            self.port_meters[(dpid, port_no)] = meter_policy.MeterState(meter_id, rate_kbps, now)
+            self.meter_allocator.reserve(dpid, meter_id)
+        # Counters saved by older versions, without port durations
+        for key in state.get('port_stats', {}):
+            self.state_store.delete('port_stats', key)
+        if self.monitoring:
+            for key, counters in state.get('port_counters', {}).items():
+                self.port_rates.set_state(key, counters)
+            if self.throughput_history is not None:
+                for (dpid, port_no), samples in state.get('history', {}).items():
+                    self.throughput_history.restore(dpid, port_no, samples)
+            for key, (name, detector_state) in state.get('detector', {}).items():
+                self.detectors.restore(key, name, detector_state)
+        self.logger.info('Restored %d MACs, %d blocked ports, %d metered ports and %d detector baselines',
+                         len(state.get('mac', {})), blocked, len(self.port_meters),
+                         len(state.get('detector', {})))
+
+    def _port_security_violation(self, dpid, port_no, mac):
+        self.logger.warning('Port %s of switch %s exceeded %d MAC addresses, dropping frames from %s',
+                            port_no, dpid, self.mac_to_port.max_per_port, fast_packet.int_to_mac(mac))
+        self.metrics.inc('sdn_port_security_violations_total', (dpid, port_no))
+        self.send_event_to_observers(mac_table.EventPortSecurityViolation(dpid, port_no, mac))
+
+    def _mac_removed(self, dpid, mac):
+        if self.state_store is not None:
+            self.state_store.delete('mac', (dpid, mac))
+
+    def _reconcile(self, datapath, stats):
+        # Align the restored state with the flows installed on the switch,
+        # which is authoritative: its L2 flows give the learned MACs, block
+        # rules left by a previous run are adopted (those installed without
+        # a timeout by older versions are installed again with one),
+        # restored blocks missing from the switch have expired meanwhile
+        # unless permanent, which are installed again, and meters whose
+        # metering entry is missing are deleted and added again. Metering
+        # entries and meters the controller does not know of (left by a
+        # previous run or a failed delete) are deleted.
+        dpid = datapath.id
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        macs, blocks = state_store.installed_state(stats)
+        self.flow_table.sync(dpid, [stat.match for stat in stats
+                                    if stat.cookie == flow_stats.COOKIE_L2 and stat.table_id == pipeline.TABLE_L2])
+        if any(stat.cookie == flow_stats.COOKIE_L2 and stat.table_id != pipeline.TABLE_L2 for stat in stats):
+            # L2 flows of the single-table pipeline of older versions, which
+            # would bypass the security table
+            self.flow_queue.send(datapath, parser.OFPFlowMod(
+                datapath=datapath, command=ofproto.OFPFC_DELETE, table_id=pipeline.TABLE_SECURITY,
+                out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY,
+                cookie=flow_stats.COOKIE_L2, cookie_mask=flow_stats.COOKIE_MASK, match=parser.OFPMatch()))
+        now = self.clock()
+        for mac, port_no in macs.items():
+            self.mac_to_port.learn(dpid, fast_packet.mac_to_int(mac), port_no, now,
+                                   limited=self.topology.is_edge(dpid, port_no))
+
+        timeouts = {}
+        for stat in stats:
+            if stat.cookie == flow_stats.COOKIE_SECURITY and stat.match.get('in_port') is not None:
+                port_no = stat.match.get('in_port')
+                timeouts[port_no] = max(timeouts.get(port_no, 0), stat.hard_timeout)
+        for port_no, rules in blocks.items():
+            key = (dpid, port_no)
+            timeout = timeouts[port_no]
+            if self.unlock_timeout is not None and not timeout:
+                # Installed without a timeout, it would never expire
+                timeout = self.port_states.blocking(key, rules, now)
+                self._install_block(datapath, key, lambda key=key: self.port_states.confirmed(key))
+            elif self.port_states.blocked(key):
+                continue
+            else:
+                self.port_states.restore(key, rules, timeout)
+            if self.state_store is not None:
+                self.state_store.put('blocked', key, [now, rules, timeout])
+            self.shard.port_blocked(dpid, port_no, now, rules)
+        for key, port in list(self.port_states.ports.items()):
+            if key[0] != dpid or key[1] in blocks or port.state != port_state.BLOCKED:
+                continue
+            if port.timeout:
+                # Expired while the controller was away
+                self.port_states.release(port, now)
+                self._port_unblocked(dpid, key[1])
+            else:
+                self.port_states.blocking(key, port.rules, now)
+                self._install_block(datapath, key, lambda key=key: self.port_states.confirmed(key))
+        if self.acl is not None:
+            import acl_policy
+            # Entries neither dropping nor going on to the metering table are
+            # left from older versions: they are replaced
+            self.acl.sync(dpid, [(dict(stat.match.items()), stat.priority,
+                                  acl_policy.ALLOW if pipeline.goes_to(datapath, stat.instructions,
+                                                                       pipeline.TABLE_METERING)
+                                  else acl_policy.DENY if not stat.instructions else None)
+                                 for stat in stats if stat.cookie == flow_stats.COOKIE_ACL])
+            self._apply_acl(datapath)
+        # Metering entries of the switch: {in_port: meter id}
+        metered = {}
+        for stat in stats:
+            if stat.cookie == flow_stats.COOKIE_METER and stat.table_id == pipeline.TABLE_METERING:
+                metered[stat.match.get('in_port')] = meter_policy.instruction_meter(datapath, stat.instructions)
+        for port_no, meter_id in metered.items():
+            meter = self.port_meters.get((dpid, port_no))
+            if meter is None or meter.meter_id != meter_id:
+                self._delete_meter_entry(datapath, port_no)
+                if meter_id is not None:
+                    self._delete_orphan_meter(datapath, meter_id)
+        # Meters without an entry are found in the meter configuration
+        datapath.send_msg(parser.OFPMeterConfigStatsRequest(datapath, 0, ofproto.OFPM_ALL))
+        for (meter_dpid, port_no), meter in self.port_meters.items():
+            if meter_dpid != dpid:
+                continue
+            if metered.get(port_no) == meter.meter_id:
+                # The meter survived with its entry: make sure of its rate
+                self.flow_queue.send(datapath, meter_policy.meter_mod(datapath, ofproto.OFPMC_MODIFY,
+                                                                      meter.meter_id, meter.rate_kbps))
+                continue
+            # The meter may be left without its entry: delete it first so
+            # that adding it is not rejected
+            self.flow_queue.send(datapath, meter_policy.meter_mod(datapath, ofproto.OFPMC_DELETE, meter.meter_id))
+            self.flow_queue.send(datapath, meter_policy.meter_mod(datapath, ofproto.OFPMC_ADD,
+                                                                  meter.meter_id, meter.rate_kbps))
+            self._add_meter_entry(datapath, port_no, meter.meter_id)
+        self.logger.info('Reconciled switch %s: %d learned MACs, %d blocked ports',
+                         dpid, len(macs), self.port_states.count(dpid))
+
+    def _apply_acl(self, datapath):
+        # Bring the firewall policy entries of the switch up to date: the new
+        # entries are added before the old ones are deleted
+        import acl_policy
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        adds, deletes = self.acl.diff(datapath.id)
+        for match, priority, action in adds:
+            # Allow goes on through the pipeline, deny drops
+            goto_table = pipeline.TABLE_METERING if action == acl_policy.ALLOW else None
+            self.add_flow(datapath, priority, parser.OFPMatch(**acl_policy.to_fields(match)), [],
+                          cookie=flow_stats.COOKIE_ACL, goto_table=goto_table)
+        for match, priority in deletes:
+            self.flow_queue.send(datapath, parser.OFPFlowMod(
+                datapath=datapath, command=ofproto.OFPFC_DELETE_STRICT, table_id=pipeline.TABLE_SECURITY,
+                priority=priority, out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY,
+                cookie=flow_stats.COOKIE_ACL, cookie_mask=flow_stats.COOKIE_MASK,
+                match=parser.OFPMatch(**acl_policy.to_fields(match))))
+        if adds or deletes:
+            self.logger.info('Firewall policy of switch %s: %d entries added, %d deleted',
+                             datapath.id, len(adds), len(deletes))
+
+    def _request_stats(self, datapath, port_no=None):
+        # port_no None (stats_scheduler.ALL_PORTS) polls the whole switch
+        import stats_scheduler
+        self.logger.debug('send stats request: %016x', datapath.id)
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        # Flow stats are only requested with the full switch poll
+        if port_no is stats_scheduler.ALL_PORTS:
+            flow_stats.request_flow_stats(datapath, self.stats_policy)
+            port_no = ofproto.OFPP_ANY
+        if self.sflow is not None:
+            # The port rates come from the sFlow samples
+            return
+
+        req = parser.OFPPortStatsRequest(datapath, 0, port_no)
+        datapath.send_msg(req)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        more = msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE
+        if self.reconcile_xids.get(dpid) == msg.xid:
+            # Flow table read when the switch connected
+            self.reconcile_flows.setdefault(dpid, []).extend(msg.body)
+            if not more:
+                del self.reconcile_xids[dpid]
+                self._reconcile(msg.datapath, self.reconcile_flows.pop(dpid))
+            return
+        if not self.monitoring:
+            return
+        self.flow_stats.flow_stats(dpid, msg.body, more, self.clock())
+        if not more and self.stats_policy == flow_stats.STATS_TALKERS:
+            self.logger.debug('Top talkers on switch %s: %s', dpid, self.flow_stats.top_talkers(dpid))
+
+    @set_ev_cls(ofp_event.EventOFPAggregateStatsReply, MAIN_DISPATCHER)
+    def _aggregate_stats_reply_handler(self, ev):
+        self.flow_stats.aggregate_stats(ev.msg.datapath.id, ev.msg.body)
+        self.flow_table.aggregate(ev.msg.datapath.id, ev.msg.body.flow_count)
+        self.metrics.set('sdn_flow_table_occupancy', (ev.msg.datapath.id,),
+                         self.flow_table.occupancy(ev.msg.datapath.id))
+
+    @set_ev_cls(ofp_event.EventOFPTableStatsReply, MAIN_DISPATCHER)
+    def _table_stats_reply_handler(self, ev):
+        dpid = ev.msg.datapath.id
+        for stat in ev.msg.body:
+            name = pipeline.TABLES.get(stat.table_id)
+            if name is not None:
+                self.metrics.set('sdn_table_active_entries', (dpid, name), stat.active_count)
+                self.metrics.set('sdn_table_lookups_total', (dpid, name), stat.lookup_count)
+                self.metrics.set('sdn_table_matched_total', (dpid, name), stat.matched_count)
+
+    @set_ev_cls(ofp_event.EventOFPMeterConfigStatsReply, MAIN_DISPATCHER)
+    def _meter_config_reply_handler(self, ev):
+        # Meters of a reconnected switch (see _reconcile): the port meters
+        # and the packet-in meter are kept
+        datapath = ev.msg.datapath
+        for config in ev.msg.body:
+            if config.meter_id != rate_limiter.PACKET_IN_METER_ID:
+                self._delete_orphan_meter(datapath, config.meter_id)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    @metrics.timed('sdn_port_stats_handler_seconds')
+    def _port_stats_reply_handler(self, ev):
+        import rates
+        # Get the datapath ID from the event message
+        dpid = ev.msg.datapath.id
+        
+        # Get the current timestamp for calculating throughput intervals
+        timestamp = self.clock()
+        self.stats_scheduler.reply_received(dpid, timestamp)
+
+        # Hand the counters over to the stats worker
+        self.stats_worker.submit(dpid, timestamp, self.rate_clock(),
+                                 [(stat.port_no, stat.rx_bytes, stat.tx_bytes, rates.port_duration(stat))
+                                  for stat in ev.msg.body])
+
+    def _sflow_rates(self, now, by_switch):
+        # Port rates of the sFlow collector, every collector interval; the
+        # samples are timed on the app clock like the port stats replies
+        timestamp = self.clock()
+        for dpid, samples in by_switch.items():
+            if dpid in self.datapaths and self.shard.owns(dpid):
+                self.stats_worker.submit_to(self._evaluate_rates, dpid, timestamp, samples)
+
+    def _evaluate_port_stats(self, dpid, timestamp, received, counters):
+        # Runs on the stats worker: returns the arguments of
+        # check_port_threshold for every port with a throughput sample
+
+        # Ports with a throughput sample in this reply
+        samples = []
+        # Iterate through each port's statistics in the reply
+        for port_no, rx_bytes, tx_bytes, duration in counters:
+            # Throughput rates in bytes per second for both receive and transmit
+            # directions (none for the first sample or after a counter reset)
+            rate = self.port_rates.update(dpid, port_no, rx_bytes, tx_bytes, duration, received)
+            if rate is None:
+                continue
+            samples.append((port_no,) + rate)
+        return self._evaluate_rates(dpid, timestamp, samples)
+
+    def _evaluate_rates(self, dpid, timestamp, samples):
+        # Runs on the stats worker: (port_no, rx_throughput, tx_throughput)
+        # samples of a switch, from its port stats or from sFlow
+
+        if self.stats_policy == flow_stats.STATS_SECURITY:
+            # Leave out the traffic dropped by the block rules, so that the
+            # baselines of the adaptive detectors do not learn the attack of
+            # a blocked port
+            samples = [(port_no, max(0, rx_throughput - self.flow_stats.dropped_rate(dpid, port_no)), tx_throughput)
+                       for port_no, rx_throughput, tx_throughput in samples]
+
+        # Record the throughput rates in the throughput dictionary
+        throughput = self.port_throughput.setdefault(dpid, {})
+        for port_no, rx_throughput, tx_throughput in samples:
+            throughput[port_no] = {'rx_throughput': rx_throughput, 'tx_throughput': tx_throughput}
+
+        if self.throughput_history is not None and samples:
+            # Add current throughput (sum of RX and TX) to the history of every
+            # port and compute all the mean + 2 * stddev thresholds at once
+            thresholds, counts = self.throughput_history.update(
+                dpid, [port_no for port_no, _, _ in samples], [rx + tx for _, rx, tx in samples], k=2)
+            thresholds, counts = thresholds.tolist(), counts.tolist()
+
+        decisions = []
+        for i, (port_no, rx_throughput, tx_throughput) in enumerate(samples):
+            # Let the detector of the port decide whether its throughput is anomalous
+            static_threshold = self.link_capacity.thresholds.get((dpid, port_no), self.initial_threshold)
+            result = self.detectors.update(dpid, port_no, max(rx_throughput, tx_throughput), static_threshold)
+            if result is not None:
+                exceeded, dynamic_threshold = result
+            else:
+                # mean + 2 * stddev, the static threshold until there are 5 samples
+                dynamic_threshold = thresholds[i] if counts[i] >= 5 else static_threshold
+                exceeded = rx_throughput > dynamic_threshold or tx_throughput > dynamic_threshold
+            decisions.append((dpid, port_no, rx_throughput, tx_throughput, exceeded, dynamic_threshold, timestamp))
+
+        # Log port statistics every 10 seconds
+        if self.log_port_stats and timestamp - self.last_log_time >= 10:
+            for dpid in self.port_throughput:
+                for port_no in self.port_throughput[dpid]:
+                    rx_throughput = self.port_throughput[dpid][port_no]['rx_throughput']
+                    tx_throughput = self.port_throughput[dpid][port_no]['tx_throughput']
+                    dynamic_threshold = self.link_capacity.thresholds.get((dpid, port_no), self.initial_threshold)
+                    self.logger.info('Port %s on switch %s - RX: %s bytes/s, TX: %s bytes/s, Threshold: %s bytes/s',
+                                    port_no, dpid, rx_throughput, tx_throughput, dynamic_threshold)
+            self.last_log_time = timestamp
+        return decisions
+
+
+    def check_port_threshold(self, dpid, port_no, rx_throughput, tx_throughput, exceeded, dynamic_threshold,
+                             timestamp):
+        # Runs on the event loop with the detector decision of the stats worker
+        static_threshold = self.link_capacity.thresholds.get((dpid, port_no), self.initial_threshold)
+        self.metrics.set('sdn_port_rx_bytes_per_second', (dpid, port_no), rx_throughput)
+        self.metrics.set('sdn_port_tx_bytes_per_second', (dpid, port_no), tx_throughput)
+        self.metrics.set('sdn_port_threshold_bytes_per_second', (dpid, port_no), dynamic_threshold)
+
+        # Poll the port faster when it is close to its threshold or blocked
+        # (sFlow samples need no polling)
+        if self.sflow is None:
+            load = max(rx_throughput, tx_throughput) / dynamic_threshold if dynamic_threshold > 0 else 0
+            self.stats_scheduler.update_port(dpid, port_no, load, self.port_states.blocked((dpid, port_no)),
+                                             timestamp)
+
+        # Direction of the traffic the detector saw (it is given the larger one)
+        self.topology.port_seen(dpid, port_no)
+        direction = topology_graph.RX if rx_throughput >= tx_throughput else topology_graph.TX
+        if exceeded and direction == topology_graph.RX and self.topology.is_edge(dpid, port_no):
+            if (dpid, port_no) not in self.ingress_alerts:
+                self.ingress_alerts.add((dpid, port_no))
+                self.shard.alert(dpid, port_no, True)
+        elif (dpid, port_no) in self.ingress_alerts:
+            self.ingress_alerts.discard((dpid, port_no))
+            self.shard.alert(dpid, port_no, False)
+
+        key = (dpid, port_no)
+        port = self.port_states.sample(key, exceeded, timestamp)
+        if exceeded:
+            # Block the port once it has been above threshold for longer than
+            # the block window (or at once without a window, or when it is a
+            # repeat offender)
+            if self.port_states.due(port, timestamp):
+                meter = self.port_meters.get(key)
+                if meter is not None:
+                    meter.below_since = None
+                if key not in self.pending_ports and self._mitigate_here(dpid, port_no, direction, timestamp):
+                    if self.port_states.repeated(port, timestamp):
+                        self.logger.warning('Threshold exceeded again on port %s of switch %s after its block',
+                                            port_no, dpid)
+                        self._block_port(dpid, port_no, timestamp)
+                    elif self.mitigation_mode != meter_policy.MITIGATE_METER:
+                        self.logger.warning('Threshold exceeded on port %s of switch %s', port_no, dpid)
+                        self._block_port(dpid, port_no, timestamp)
+                    elif meter is None:
+                        # First cap the port at its fair share
+                        self.logger.warning('Threshold exceeded on port %s of switch %s', port_no, dpid)
+                        self._meter_port(dpid, port_no, self.fair_share_ratio * static_threshold)
+                    elif timestamp - meter.since > self.escalate_window:
+                        # Still exceeding while metered: drop its traffic
+                        self.logger.warning('Threshold still exceeded on metered port %s of switch %s', port_no, dpid)
+                        self._block_port(dpid, port_no, timestamp)
+        else:
+            self.localized_ports.discard(key)
+            if self.mitigation_mode == flow_mitigation.MITIGATE_FLOW and not self.port_states.blocked(key):
+                # Baseline of the sources of the port, for flow mitigation
+                self.flow_mitigator.observe(dpid, port_no, self._port_sources(dpid, port_no))
+            # A metered port (no longer dropped) gets its meter removed once
+            # it has stayed below threshold long enough
+            meter = self.port_meters.get(key)
+            if (meter is not None and self.unlock_timeout is not None and key not in self.pending_ports
+                    and not self.port_states.blocked(key)):
+                if meter.below_since is None:
+                    meter.below_since = timestamp
+                elif timestamp - meter.below_since > self.unlock_timeout:
+                    self._unmeter_port(dpid, port_no)
+
+    def _mitigate_here(self, dpid, port_no, direction, timestamp):
+        # Whether the port exceeding its threshold is mitigated itself, or
+        # left to the ingress edge ports its traffic comes from
+        if not self.localization or (direction == topology_graph.RX and self.topology.is_edge(dpid, port_no)):
+            return True
+        for key in self.topology.ingress_ports(dpid, port_no, direction):
+            # Ports of switches owned by other workers are known from the
+            # shard bus
+            if (key in self.ingress_alerts or self.port_states.blocked(key) or key in self.pending_ports
+                    or key in self.port_meters or key in self.shard.blocked or key in self.shard.metered
+                    or key in self.shard.alerts):
+                if (dpid, port_no) not in self.localized_ports:
+                    self.localized_ports.add((dpid, port_no))
+                    self.metrics.inc('sdn_alerts_localized_total', (dpid, port_no))
+                    self.logger.info('Threshold exceeded on port %s of switch %s, left to ingress port %s '
+                                     'of switch %s', port_no, dpid, key[1], key[0])
+                return False
+        # No ingress port found (several sources each below threshold, or a
+        # source outside the topology): mitigate the port once the ingress
+        # ports had time to report
+        return timestamp - self.port_states.get((dpid, port_no)).since > self.block_window + self.localization_grace
+
+    def _block_port(self, dpid, port_no, timestamp):
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            self.logger.error('Datapath %s not found', dpid)
+            return
+
+        # Drop only the offending sources in flow mode, the whole port otherwise
+        matches = None
+        if self.mitigation_mode == flow_mitigation.MITIGATE_FLOW:
+            matches = self.flow_mitigator.select(self._port_sources(dpid, port_no), dpid, port_no)
+            if matches and self.flow_mitigator.residual:
+                self.logger.info('Flow mitigation of port %s of switch %s leaves out %.1f%% of its excess traffic',
+                                 port_no, dpid, 100 * self.flow_mitigator.residual)
+        if not matches:
+            matches = [{}]
+        rules = [dict(fields, in_port=port_no) for fields in matches]
+        self.port_states.blocking((dpid, port_no), rules, timestamp)
+        self._install_block(datapath, (dpid, port_no), lambda: self._port_blocked(dpid, port_no, timestamp))
+
+    def _port_sources(self, dpid, port_no):
+        # Sources of the traffic entering on the port since the previous call.
+        # Packet-in samples and flow stats are weighted differently, use the
+        # samples when there are any
+        sources = self.source_sampler.take(dpid, port_no)
+        if not sources and self.sflow is not None:
+            sources = self.sflow.take(dpid, port_no)
+        return sources or self.flow_stats.sources(dpid, port_no)
+
+    def _install_block(self, datapath, key, callback):
+        # Drop rules of a port in the blocking state, expiring on the switch
+        # after its hard timeout or once its sources are silent for
+        # unlock_timeout seconds; the switch reports their removal
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        port = self.port_states.get(key)
+        idle_timeout = self.unlock_timeout if port.timeout else 0
+        actions = []  # Drop all matching packets
+        for i, fields in enumerate(port.rules):
+            # The port state is updated once the last rule is confirmed
+            self.add_flow(datapath, self.security_priority, parser.OFPMatch(**fields), actions,
+                          callback=callback if i == len(port.rules) - 1 else None,
+                          cookie=flow_stats.COOKIE_SECURITY, idle_timeout=idle_timeout,
+                          hard_timeout=port.timeout, flags=ofproto.OFPFF_SEND_FLOW_REM)
+
+    def _port_blocked(self, dpid, port_no, timestamp):
+        # The block rules are installed on the switch: update the port state
+        self.port_states.confirmed((dpid, port_no))
+        port = self.port_states.get((dpid, port_no))
+        self.metrics.inc('sdn_port_blocks_total', (dpid, port_no))
+        if self.state_store is not None:
+            self.state_store.put('blocked', (dpid, port_no), [timestamp, port.rules, port.timeout])
+        self.shard.port_blocked(dpid, port_no, timestamp, port.rules)
+        self.logger.info('\n---\n---\nBlocking port %s on switch %s for %s\n---\n---\n', port_no, dpid,
+                         '%d s' % port.timeout if port.timeout else 'good')
+
+    def _meter_port(self, dpid, port_no, rate):
+        # Cap the traffic entering on the port at `rate` bytes/s: add a meter
+        # and an entry of the metering table sending the port through it
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            self.logger.error('Datapath %s not found', dpid)
+            return
+
+        ofproto = datapath.ofproto
+        rate_kbps = max(1, int(rate * 8 / 1000))
+        meter_id = self.meter_allocator.allocate(dpid)
+        self.port_meters[(dpid, port_no)] = meter_policy.MeterState(meter_id, rate_kbps, self.clock())
+        self.pending_ports.add((dpid, port_no))
+        self.flow_queue.send(datapath, meter_policy.meter_mod(datapath, ofproto.OFPMC_ADD, meter_id, rate_kbps))
+        self._add_meter_entry(datapath, port_no, meter_id, lambda: self._port_metered(dpid, port_no, rate_kbps))
+
+    def _add_meter_entry(self, datapath, port_no, meter_id, callback=None):
+        parser = datapath.ofproto_parser
+        self.add_flow(datapath, pipeline.METER_PRIORITY, parser.OFPMatch(in_port=port_no), [], meter_id=meter_id,
+                      callback=callback, cookie=flow_stats.COOKIE_METER, table_id=pipeline.TABLE_METERING,
+                      goto_table=pipeline.TABLE_L2)
+
+    def _delete_meter_entry(self, datapath, port_no):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.flow_queue.send(datapath, parser.OFPFlowMod(
+            datapath=datapath, command=ofproto.OFPFC_DELETE_STRICT, table_id=pipeline.TABLE_METERING,
+            priority=pipeline.METER_PRIORITY, out_port=ofproto.OFPP_ANY, out_group=ofproto.OFPG_ANY,
+            cookie=flow_stats.COOKIE_METER, cookie_mask=flow_stats.COOKIE_MASK,
+            match=parser.OFPMatch(in_port=port_no)))
+
+    def _meter_in_use(self, dpid, meter_id):
+        return any(key[0] == dpid and meter.meter_id == meter_id for key, meter in self.port_meters.items())
+
+    def _delete_orphan_meter(self, datapath, meter_id):
+        # Delete a meter of the switch unknown to the controller and free its id
+        dpid = datapath.id
+        if self._meter_in_use(dpid, meter_id):
+            return
+        self.logger.info('Deleting meter %s left on switch %s', meter_id, dpid)
+        self.flow_queue.send(datapath, meter_policy.meter_mod(datapath, datapath.ofproto.OFPMC_DELETE, meter_id))
+        self.meter_allocator.reserve(dpid, meter_id)
+        self.meter_allocator.release(dpid, meter_id)
+
+    def _port_metered(self, dpid, port_no, rate_kbps):
+        self.pending_ports.discard((dpid, port_no))
+        meter = self.port_meters.get((dpid, port_no))
+        if self.state_store is not None and meter is not None:
+            self.state_store.put('meter', (dpid, port_no), [meter.meter_id, rate_kbps])
+        self.shard.port_metered(dpid, port_no)
+        self.logger.info('Metering port %s on switch %s at %s kbit/s', port_no, dpid, rate_kbps)
+
+    def _unmeter_port(self, dpid, port_no):
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            self.logger.error('Datapath %s not found', dpid)
+            return
+
+        ofproto = datapath.ofproto
+        meter = self.port_meters.pop((dpid, port_no))
+        self.pending_ports.add((dpid, port_no))
+        # The entry goes before the meter it refers to
+        self._delete_meter_entry(datapath, port_no)
+        self.flow_queue.send(datapath, meter_policy.meter_mod(datapath, ofproto.OFPMC_DELETE, meter.meter_id),
+                             lambda: self._port_unmetered(dpid, port_no, meter.meter_id))
+
+    def _port_unmetered(self, dpid, port_no, meter_id):
+        self.pending_ports.discard((dpid, port_no))
+        if not self._meter_in_use(dpid, meter_id):
+            # Unless freed as an orphan and handed out again meanwhile
+            self.meter_allocator.release(dpid, meter_id)
+        if self.state_store is not None:
+            self.state_store.delete('meter', (dpid, port_no))
+        self.shard.port_unmetered(dpid, port_no)
+        self.logger.info('Removing meter of port %s on switch %s', port_no, dpid)
+
+    def _port_unblocked(self, dpid, port_no):
+        # The block rules have left the switch: the port state is already idle
+        self.metrics.inc('sdn_port_unblocks_total', (dpid, port_no))
+        if self.monitoring:
+            self.flow_stats.port_unblocked(dpid, port_no)
+        if self.state_store is not None:
+            self.state_store.delete('blocked', (dpid, port_no))
+        self.shard.port_unblocked(dpid, port_no)
+        self.logger.info('\n---\n---\nUnblocking port %s on switch %s\n---\n---\n', port_no, dpid)
+
+# Funzione principale
+if __name__ == '__main__':
+    from ryu.cmd import manager
+    manager.main()
@@ -0,0 +1,323 @@
+# sFlow v5 collector: push-based port and flow telemetry as an alternative
+# to polling the port statistics.
+#
+# Open vSwitch samples one packet out of `sampling` on every port and sends
+# the headers of the samples to the collector over UDP:
+#
+#   ovs-vsctl -- --id=@s create sflow agent=lo target=\"127.0.0.1:6343\" \
+#       sampling=64 polling=0 -- set bridge s1 sflow=@s
+#
+# Datagrams are read in batches with recv_into into preallocated buffers and
+# decoded in place. The flow samples give the bytes received and sent by
+# every port (frame length times sampling rate) and the bytes of every source
+# (eth_src, ipv4_src, ip_proto, l4_dst) received on a port; every `interval`
+# seconds the port rates are handed to a callback, which feeds them to the
+# detectors of the app. A port once sampled is reported, at a rate decaying
+# to 0 when its samples stop, until the app forgets it (forget_port,
+# forget_datapath), so that its detector and mitigation see it go quiet.
+# Counter samples are not used (polling=0).
+#
+# Ports are identified by the ifIndex of their interface, mapped to
+# (dpid, port_no) with the "ifindex" of the entries of the link bandwidth file
+# exported by the topology scripts.
+#
+# Datagrams can be recorded to a file and replayed, at their recorded pace,
+# without a switch:
+#
+#   python sflow_collector.py --record sflow.bin
+#   python sflow_collector.py --replay sflow.bin
+
+import argparse
+import collections
+import json
+import socket
+import struct
+import time
+
+import fast_packet
+import flow_mitigation
+
+SFLOW_VERSION = 5
+ADDRESS_IPV4 = 1
+ADDRESS_IPV6 = 2
+
+# Sample and record formats (enterprise 0)
+FLOW_SAMPLE = 1
+FLOW_SAMPLE_EXPANDED = 3
+RAW_PACKET_HEADER = 1
+HEADER_ETHERNET = 1
+
+# Input/output ifIndex of a compact flow sample: 2 format bits, 30 value bits
+PORT_FORMAT_SHIFT = 30
+PORT_VALUE_MASK = 0x3fffffff
+PORT_UNKNOWN = 0x3fffffff
+
+# Record file: (receive time, length) before every datagram
+RECORD_HEADER = struct.Struct('!dI')
+
+_U32 = struct.Struct('!I')
+_DATAGRAM_HEADER = struct.Struct('!II')  # version, agent address type
+_FLOW_SAMPLE = struct.Struct('!IIIIIIII')  # compact flow sample up to the record count
+_FLOW_SAMPLE_EXPANDED = struct.Struct('!IIIIIIIIIII')
+_SAMPLE_HEADER = struct.Struct('!II')  # format, length
+_RAW_HEADER = struct.Struct('!IIII')  # protocol, frame length, stripped, header size
+
+
+def load_ifindex(entries):
+    # ifindex -> (dpid, port_no) of the "ports" entries of the link bandwidth file
+    ports = {}
+    for entry in entries:
+        if entry.get('ifindex') is not None:
+            ports[int(entry['ifindex'])] = (int(entry['dpid']), int(entry['port']))
+    return ports
+
+
+class SFlowCollector(object):
+
+    def __init__(self, ports=None, on_rates=None, host='127.0.0.1', port=6343, interval=0.5, alpha=0.5,
+                 batch=64, buffer_size=65536, max_sources=1024, logger=None):
+        self.ports = ports or {}  # ifindex -> (dpid, port_no)
+        self.on_rates = on_rates  # on_rates(timestamp, {dpid: [(port_no, rx, tx)]}) every interval
+        self.host = host
+        self.port = port
+        self.interval = interval  # seconds between two rate reports
+        self.alpha = alpha  # EWMA weight of the rates (1 disables smoothing)
+        self.batch = batch  # datagrams read per wakeup
+        self.max_sources = max_sources  # sources counted per port
+        self.logger = logger
+
+        self.buffers = [bytearray(buffer_size) for _ in range(batch)]
+        self.views = [memoryview(buffer) for buffer in self.buffers]
+        self.sock = None
+
+        # Bytes received and sent by every (dpid, port_no) since the last report
+        self.rx_bytes = collections.Counter()
+        self.tx_bytes = collections.Counter()
+        self.sources = {}  # (dpid, port_no) -> Counter of the sampled sources
+        self.rates = {}  # (dpid, port_no) -> [rx_rate, tx_rate]
+        self.last_report = None
+        self.datagrams = 0
+        self.errors = 0
+        self.unknown = 0  # samples of interfaces missing from ports
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind((self.host, self.port))
+        self.sock.setblocking(False)
+
+    def receive(self, record=None):
+        # Read and decode up to `batch` datagrams; returns how many. record
+        # is an open binary file the datagrams are also written to.
+        received = []
+        for view in self.views:
+            try:
+                size = self.sock.recv_into(view)
+            except (BlockingIOError, InterruptedError):
+                break
+            received.append((view, size))
+        now = time.time()
+        for view, size in received:
+            if record is not None:
+                record.write(RECORD_HEADER.pack(now, size))
+                record.write(view[:size])
+            self.decode(view, size)
+        return len(received)
+
+    def serve(self, sleep, clock=time.time, poll_interval=0.05):
+        # Green thread of the app; sleep is hub.sleep
+        try:
+            self.open()
+        except socket.error as e:
+            if self.logger is not None:
+                self.logger.error('Could not start the sFlow collector on %s:%s: %s', self.host, self.port, e)
+            return
+        if self.logger is not None:
+            self.logger.info('sFlow collector listening on %s:%s', self.host, self.port)
+        while True:
+            while self.receive() == self.batch:
+                pass
+            self.report(clock())
+            sleep(poll_interval)
+
+    def replay(self, path, sleep=None):
+        # Decode the datagrams of a record file, sleeping between them as
+        # they were received (sleep None: as fast as possible)
+        previous = None
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                timestamp, size = RECORD_HEADER.unpack(header)
+                if size > len(self.buffers[0]):
+                    f.seek(size, 1)
+                    continue
+                view = self.views[0]
+                if f.readinto(view[:size]) < size:
+                    break
+                if sleep is not None and previous is not None and timestamp > previous:
+                    sleep(timestamp - previous)
+                previous = timestamp
+                self.decode(view, size)
+                self.report(timestamp)
+        if previous is not None:
+            self.report(previous + self.interval)
+
+    def decode(self, data, size):
+        # Decode one datagram; malformed ones are counted and dropped
+        self.datagrams += 1
+        try:
+            version, address_type = _DATAGRAM_HEADER.unpack_from(data, 0)
+            if version != SFLOW_VERSION:
+                raise ValueError('sFlow version %s' % version)
+            offset = 8 + (16 if address_type == ADDRESS_IPV6 else 4)
+            # sub agent id, sequence number, uptime
+            offset += 12
+            samples = _U32.unpack_from(data, offset)[0]
+            offset += 4
+            for _ in range(samples):
+                sample_format, length = _SAMPLE_HEADER.unpack_from(data, offset)
+                offset += 8
+                end = offset + length
+                if end > size:
+                    raise ValueError('sample past the end of the datagram')
+                if sample_format == FLOW_SAMPLE:
+                    fields = _FLOW_SAMPLE.unpack_from(data, offset)
+                    rate, input_port, output_port, records = fields[2], fields[5], fields[6], fields[7]
+                    input_port = input_port & PORT_VALUE_MASK if input_port >> PORT_FORMAT_SHIFT == 0 else None
+                    output_port = output_port & PORT_VALUE_MASK if output_port >> PORT_FORMAT_SHIFT == 0 else None
+                    self._flow_sample(data, offset + _FLOW_SAMPLE.size, end, rate, input_port, output_port, records)
+                elif sample_format == FLOW_SAMPLE_EXPANDED:
+                    fields = _FLOW_SAMPLE_EXPANDED.unpack_from(data, offset)
+                    rate, records = fields[3], fields[10]
+                    input_port = fields[7] if fields[6] == 0 else None
+                    output_port = fields[9] if fields[8] == 0 else None
+                    self._flow_sample(data, offset + _FLOW_SAMPLE_EXPANDED.size, end, rate, input_port,
+                                      output_port, records)
+                offset = end
+        except (struct.error, ValueError) as e:
+            self.errors += 1
+            if self.logger is not None and self.errors == 1:
+                self.logger.warning('Dropping malformed sFlow datagram: %s', e)
+
+    def _flow_sample(self, data, offset, end, rate, input_port, output_port, records):
+        for _ in range(records):
+            record_format, length = _SAMPLE_HEADER.unpack_from(data, offset)
+            offset += 8
+            if record_format == RAW_PACKET_HEADER:
+                protocol, frame_length, _, header_size = _RAW_HEADER.unpack_from(data, offset)
+                weight = frame_length * rate
+                if input_port is not None and input_port != PORT_UNKNOWN:
+                    key = self.ports.get(input_port)
+                    if key is None:
+                        self.unknown += 1
+                    else:
+                        self.rx_bytes[key] += weight
+                        if protocol == HEADER_ETHERNET:
+                            start = offset + _RAW_HEADER.size
+                            self._source(key, bytes(data[start:min(start + header_size, end)]), weight)
+                if output_port is not None and output_port != PORT_UNKNOWN:
+                    key = self.ports.get(output_port)
+                    if key is not None:
+                        self.tx_bytes[key] += weight
+            offset += length
+
+    def _source(self, key, header, weight):
+        decoded = fast_packet.parse_eth_header(header)
+        if decoded is None:
+            return
+        source = ((fast_packet.int_to_mac(decoded[1]),)
+                  + (flow_mitigation.parse_ipv4_source(header) or (None, None, None)))
+        counter = self.sources.setdefault(key, collections.Counter())
+        if source in counter or len(counter) < self.max_sources:
+            counter[source] += weight
+
+    def report(self, now):
+        # Every interval: turn the sampled bytes into smoothed rates and
+        # hand them to on_rates
+        if self.last_report is None:
+            self.last_report = now
+            return
+        elapsed = now - self.last_report
+        if elapsed < self.interval:
+            return
+        self.last_report = now
+        alpha = self.alpha
+        for key in set(self.rx_bytes) | set(self.tx_bytes):
+            if key not in self.rates:
+                self.rates[key] = [None, None]
+        by_switch = {}
+        for key, state in self.rates.items():
+            rx_rate = self.rx_bytes.get(key, 0) / elapsed
+            tx_rate = self.tx_bytes.get(key, 0) / elapsed
+            if state[0] is not None:
+                rx_rate = alpha * rx_rate + (1 - alpha) * state[0]
+                tx_rate = alpha * tx_rate + (1 - alpha) * state[1]
+            state[0], state[1] = rx_rate, tx_rate
+            by_switch.setdefault(key[0], []).append((key[1], rx_rate, tx_rate))
+        self.rx_bytes.clear()
+        self.tx_bytes.clear()
+        if self.on_rates is not None and by_switch:
+            self.on_rates(now, by_switch)
+
+    def take(self, dpid, port_no):
+        # Sources sampled on the port since the previous call, as
+        # flow_mitigation.SourceSampler.take
+        return list(self.sources.pop((dpid, port_no), {}).items())
+
+    def forget_port(self, dpid, port_no):
+        self.sources.pop((dpid, port_no), None)
+        self.rates.pop((dpid, port_no), None)
+
+    def forget_datapath(self, dpid):
+        for table in (self.sources, self.rates):
+            for key in [key for key in table if key[0] == dpid]:
+                del table[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sFlow collector: record datagrams or replay a record')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6343)
+    parser.add_argument('--record', help='write the received datagrams to this file')
+    parser.add_argument('--replay', help='decode the datagrams of a record file')
+    parser.add_argument('--bandwidth-file', default='link_bandwidth.json',
+                        help='link bandwidth file giving the ifindex of the switch ports')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between two rate reports')
+    args = parser.parse_args()
+
+    try:
+        with open(args.bandwidth_file) as f:
+            ports = load_ifindex(json.load(f).get('ports', []))
+    except (OSError, ValueError):
+        ports = {}
+
+    def print_rates(now, by_switch):
+        for dpid, samples in sorted(by_switch.items()):
+            for port_no, rx_rate, tx_rate in sorted(samples):
+                print('%.3f switch %s port %s - RX: %.0f bytes/s, TX: %.0f bytes/s' % (now, dpid, port_no,
+                                                                                       rx_rate, tx_rate))
+
+    collector = SFlowCollector(ports, print_rates, args.host, args.port, interval=args.interval)
+    if args.replay:
+        collector.replay(args.replay)
+        print('%d datagrams, %d malformed, %d samples of unknown interfaces'
+              % (collector.datagrams, collector.errors, collector.unknown))
+        return
+    collector.open()
+    record = open(args.record, 'wb') if args.record else None
+    try:
+        while True:
+            if collector.receive(record) < collector.batch:
+                time.sleep(0.05)
+            collector.report(time.time())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if record is not None:
+            record.close()
+
+
+if __name__ == '__main__':
+    main()
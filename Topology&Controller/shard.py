@@ -0,0 +1,196 @@
+# Sharded deployment of a controller app.
+#
+# N ryu-manager worker processes listen on consecutive OpenFlow ports and
+# every switch connects to all of them (see the topology scripts). Each
+# worker owns the switches whose dpid hashes to its index: it asks them for
+# the MASTER role and takes the SLAVE role on the others, so packet-ins,
+# flow-removed messages and stats of a switch are only handled by its owner,
+# one core per worker. Block/unblock and meter decisions and the alerts of
+# edge ports are published to the other workers over Unix datagram sockets,
+# so every worker has the same view of the mitigated ports.
+#
+# Usage:
+#   python shard.py --workers 4 sdn_firewall.py
+#   SDN_SHARD_COUNT=4 sudo -E python topology.py
+
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import zlib
+
+ENV_INDEX = 'SDN_SHARD_INDEX'
+ENV_COUNT = 'SDN_SHARD_COUNT'
+ENV_SOCKET_DIR = 'SDN_SHARD_SOCKET_DIR'
+ENV_BASE_PORT = 'SDN_SHARD_BASE_PORT'
+
+DEFAULT_SOCKET_DIR = '/tmp/sdn_shards'
+DEFAULT_BASE_PORT = 6653
+
+
+def shard_of(dpid, count):
+    # Stable hash of the dpid, so that consecutive dpids spread evenly
+    return zlib.crc32(dpid.to_bytes(8, 'big')) % count
+
+
+class Shard(object):
+    # Membership of one worker. With count 1 (the default, no environment)
+    # the worker owns every switch and neither roles nor the bus are used.
+
+    def __init__(self, index=0, count=1, socket_dir=DEFAULT_SOCKET_DIR, logger=None):
+        self.index = index
+        self.count = count
+        self.socket_dir = socket_dir
+        self.logger = logger
+        self.bus = None
+        # (dpid, port_no) -> [since, rules] of the ports blocked by every
+        # worker, for the decisions involving ports of other workers'
+        # switches (localization of the alerts to their ingress port)
+        self.blocked = {}
+        self.metered = set()  # (dpid, port_no) of the ports metered by every worker
+        self.alerts = set()  # (dpid, port_no) of the edge ports above threshold
+
+    @classmethod
+    def from_env(cls, logger=None):
+        return cls(int(os.environ.get(ENV_INDEX, '0')), int(os.environ.get(ENV_COUNT, '1')),
+                   os.environ.get(ENV_SOCKET_DIR, DEFAULT_SOCKET_DIR), logger)
+
+    @property
+    def sharded(self):
+        return self.count > 1
+
+    def owns(self, dpid):
+        return self.count == 1 or shard_of(dpid, self.count) == self.index
+
+    def start(self, spawn):
+        # Open the bus; spawn(function) runs its receive loop (hub.spawn)
+        if not self.sharded:
+            return
+        self.bus = ShardBus(self.socket_dir, self.index, self.count, self.logger)
+        spawn(self.bus.receive_loop, self._apply)
+
+    def request_role(self, datapath):
+        # MASTER on the owned switches, SLAVE on the others. The generation id
+        # only has to grow across requests, milliseconds since the epoch do.
+        if not self.sharded:
+            return
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        role = ofproto.OFPCR_ROLE_MASTER if self.owns(datapath.id) else ofproto.OFPCR_ROLE_SLAVE
+        datapath.send_msg(parser.OFPRoleRequest(datapath, role, int(time.time() * 1000)))
+
+    def port_blocked(self, dpid, port_no, since, rules):
+        self.blocked[(dpid, port_no)] = [since, rules]
+        self._publish({'kind': 'block', 'dpid': dpid, 'port': port_no, 'since': since, 'rules': rules})
+
+    def port_unblocked(self, dpid, port_no):
+        self.blocked.pop((dpid, port_no), None)
+        self._publish({'kind': 'unblock', 'dpid': dpid, 'port': port_no})
+
+    def port_metered(self, dpid, port_no):
+        self.metered.add((dpid, port_no))
+        self._publish({'kind': 'meter', 'dpid': dpid, 'port': port_no})
+
+    def port_unmetered(self, dpid, port_no):
+        self.metered.discard((dpid, port_no))
+        self._publish({'kind': 'unmeter', 'dpid': dpid, 'port': port_no})
+
+    def alert(self, dpid, port_no, raised):
+        # Published when the alert starts and ends, not with every sample
+        if raised:
+            self.alerts.add((dpid, port_no))
+        else:
+            self.alerts.discard((dpid, port_no))
+        self._publish({'kind': 'alert' if raised else 'alert_end', 'dpid': dpid, 'port': port_no})
+
+    def _publish(self, message):
+        if self.bus is not None:
+            self.bus.publish(message)
+
+    def _apply(self, message):
+        key = (message['dpid'], message['port'])
+        if message['kind'] == 'block':
+            self.blocked[key] = [message['since'], message['rules']]
+        elif message['kind'] == 'unblock':
+            self.blocked.pop(key, None)
+        elif message['kind'] == 'meter':
+            self.metered.add(key)
+        elif message['kind'] == 'unmeter':
+            self.metered.discard(key)
+        elif message['kind'] == 'alert':
+            self.alerts.add(key)
+        elif message['kind'] == 'alert_end':
+            self.alerts.discard(key)
+
+
+class ShardBus(object):
+    # Local message bus between the workers: one Unix datagram socket per
+    # worker in socket_dir, JSON messages sent to every other worker. Sending
+    # never blocks; messages to a worker that is down are dropped.
+
+    def __init__(self, socket_dir, index, count, logger=None):
+        self.logger = logger
+        self.peers = [self.path(socket_dir, i) for i in range(count) if i != index]
+        if not os.path.isdir(socket_dir):
+            os.makedirs(socket_dir)
+        path = self.path(socket_dir, index)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.out.setblocking(False)
+
+    @staticmethod
+    def path(socket_dir, index):
+        return os.path.join(socket_dir, 'worker%d.sock' % index)
+
+    def publish(self, message):
+        data = json.dumps(message).encode('utf-8')
+        for peer in self.peers:
+            try:
+                self.out.sendto(data, peer)
+            except (socket.error, OSError) as e:
+                if self.logger is not None:
+                    self.logger.debug('Shard message to %s dropped: %s', peer, e)
+
+    def receive_loop(self, callback):
+        while True:
+            data = self.sock.recv(65536)
+            try:
+                message = json.loads(data.decode('utf-8'))
+            except ValueError:
+                continue
+            callback(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a controller app as N sharded ryu-manager workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--base-port', type=int, default=DEFAULT_BASE_PORT,
+                        help='OpenFlow port of worker 0, worker i listens on base + i')
+    parser.add_argument('--socket-dir', default=DEFAULT_SOCKET_DIR)
+    parser.add_argument('app', help='controller app, e.g. sdn_firewall.py')
+    args = parser.parse_args()
+
+    workers = []
+    for index in range(args.workers):
+        env = dict(os.environ)
+        env.update({ENV_INDEX: str(index), ENV_COUNT: str(args.workers), ENV_SOCKET_DIR: args.socket_dir})
+        cmd = ['ryu-manager', '--ofp-tcp-listen-port', str(args.base_port + index), args.app]
+        workers.append(subprocess.Popen(cmd, env=env))
+
+    def stop(signum, frame):
+        for worker in workers:
+            worker.terminate()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    sys.exit(max(worker.wait() for worker in workers))
+
+
+if __name__ == '__main__':
+    main()
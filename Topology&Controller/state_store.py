@@ -0,0 +1,135 @@
+import json
+import os
+
+import flow_stats
+
+_MISSING = object()
+
+
+class StateStore(object):
+    # Controller state persisted across restarts, as an append-only log of
+    # JSON lines [kind, key, value] (a null value deletes the key; tuple keys
+    # are stored as lists). Changes are buffered with put()/delete() and
+    # appended by flush(), which the apps call periodically off the event
+    # handlers; once the log holds compact_ratio times more lines than live
+    # entries it is rewritten with the current state (temporary file +
+    # rename, so a crash never leaves a half-written snapshot).
+
+    def __init__(self, path, compact_ratio=4, logger=None):
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self.logger = logger
+        self.state = {}  # kind -> {key: value}
+        self.dirty = {}  # (kind, key) -> value not yet written
+        self.lines = 0  # lines in the log file
+
+    def load(self):
+        # Read the log; returns the state as {kind: {key: value}}
+        state = {}
+        lines = 0
+        truncated = False
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        kind, key, value = json.loads(line)
+                    except ValueError:
+                        # Last line cut short by a crash
+                        truncated = True
+                        break
+                    lines += 1
+                    if isinstance(key, list):
+                        key = tuple(key)
+                    table = state.setdefault(kind, {})
+                    if value is None:
+                        table.pop(key, None)
+                    else:
+                        table[key] = value
+        except (IOError, OSError) as e:
+            if self.logger is not None:
+                self.logger.info('No controller state loaded from %s: %s', self.path, e)
+            return state
+        self.state = state
+        self.lines = lines
+        if truncated:
+            self.compact()
+        return state
+
+    def put(self, kind, key, value):
+        self.dirty[(kind, key)] = value
+
+    def delete(self, kind, key):
+        self.dirty[(kind, key)] = None
+
+    def flush(self):
+        # Append the buffered changes to the log, compacting it if needed
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, {}
+        lines = []
+        for (kind, key), value in dirty.items():
+            table = self.state.setdefault(kind, {})
+            if value is None:
+                if table.pop(key, _MISSING) is _MISSING:
+                    continue
+            else:
+                table[key] = value
+            lines.append(json.dumps([kind, list(key) if isinstance(key, tuple) else key, value]))
+
+        live = sum(len(table) for table in self.state.values())
+        try:
+            if self.lines + len(lines) > self.compact_ratio * max(live, 64):
+                self.compact()
+            elif lines:
+                with open(self.path, 'a') as f:
+                    f.write('\n'.join(lines) + '\n')
+                self.lines += len(lines)
+        except (IOError, OSError) as e:
+            if self.logger is not None:
+                self.logger.error('Could not write controller state to %s: %s', self.path, e)
+
+    def compact(self):
+        tmp = self.path + '.tmp'
+        lines = 0
+        with open(tmp, 'w') as f:
+            for kind, table in self.state.items():
+                for key, value in table.items():
+                    f.write(json.dumps([kind, list(key) if isinstance(key, tuple) else key, value]) + '\n')
+                    lines += 1
+        os.rename(tmp, self.path)
+        self.lines = lines
+
+
+def request_flow_table(datapath):
+    # Ask the switch for all its flows; returns the xid of the request so that
+    # the reply can be told apart from the periodic flow stats
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+
+    req = parser.OFPFlowStatsRequest(datapath, 0, ofproto.OFPTT_ALL,
+                                     ofproto.OFPP_ANY, ofproto.OFPG_ANY,
+                                     0, 0, parser.OFPMatch())
+    datapath.set_xid(req)
+    datapath.send_msg(req)
+    return req.xid
+
+
+def installed_state(stats):
+    # From the flow stats of a switch: {eth_src: in_port} of the learned L2
+    # flows and {in_port: [match fields]} of the block rules
+    macs = {}
+    blocks = {}
+    for stat in stats:
+        in_port = stat.match.get('in_port')
+        if stat.cookie == flow_stats.COOKIE_L2:
+            src = stat.match.get('eth_src')
+            if src is not None:
+                macs[src] = in_port
+        elif stat.cookie == flow_stats.COOKIE_SECURITY and in_port is not None:
+            blocks.setdefault(in_port, []).append(dict(stat.match.items()))
+    return macs, blocks
+
+
+def match_fields(fields):
+    # Match fields read back from JSON: masked values are lists again
+    return dict((name, tuple(value) if isinstance(value, list) else value) for name, value in fields.items())
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import random
+
+# Port number used in the schedule for a request covering all the ports
+ALL_PORTS = None
+
+
+class StatsScheduler(object):
+    # Schedules the port statistics requests sent by the monitor thread.
+    #
+    # Every switch gets a full port stats request each max_interval seconds,
+    # starting at a random offset so that the requests of different switches
+    # are spread over the interval instead of leaving at the same instant.
+    # Ports close to their threshold (or blocked) are additionally polled on
+    # their own, with an interval going down to min_interval as the load
+    # approaches the threshold. Switches answering slowly get their intervals
+    # multiplied by a backoff factor; a request left unanswered for its own
+    # interval (max_interval for a full poll) is given up as lost and sent
+    # again at the next slot. The number of requests therefore grows with
+    # the number of suspicious ports, not with the total port count.
+    #
+    # With port_stats False (port rates pushed by sFlow) only the full switch
+    # polls are scheduled, for the flow statistics; they get no port stats
+    # reply, so their replies are not waited for.
+
+    def __init__(self, min_interval=1.0, max_interval=10.0, near_ratio=0.5,
+                 slow_reply=0.5, max_backoff=8, jitter=0.1, port_stats=True, logger=None):
+        self.min_interval = min_interval  # seconds, for blocked or overloaded ports
+        self.max_interval = max_interval  # seconds, for the full switch poll
+        self.near_ratio = near_ratio  # load/threshold ratio above which a port is polled on its own
+        self.slow_reply = slow_reply  # seconds, reply time above which a switch is backed off
+        self.max_backoff = max_backoff
+        self.jitter = jitter  # relative random spread of every interval
+        self.port_stats = port_stats
+        self.logger = logger
+
+        self.heap = []  # (due time, sequence, dpid, port_no)
+        self.sequence = itertools.count()
+        self.datapaths = set()
+        self.port_interval = {}  # (dpid, port_no) -> interval of the ports polled on their own
+        self.port_due = {}  # (dpid, port_no) -> due time of the valid heap entry of the port
+        self.backoff = {}  # dpid -> multiplier of the intervals of the switch
+        self.outstanding = {}  # dpid -> (send time, interval) of the oldest unanswered request
+
+    def _push(self, due, dpid, port_no):
+        heapq.heappush(self.heap, (due, next(self.sequence), dpid, port_no))
+
+    def _spread(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def add_datapath(self, dpid, now):
+        if dpid in self.datapaths:
+            return
+        self.datapaths.add(dpid)
+        self.backoff[dpid] = 1
+        self._push(now + random.uniform(0, self.max_interval), dpid, ALL_PORTS)
+
+    def remove_datapath(self, dpid):
+        # Heap entries of the switch are discarded when they become due
+        self.datapaths.discard(dpid)
+        self.backoff.pop(dpid, None)
+        self.outstanding.pop(dpid, None)
+        for key in [key for key in self.port_interval if key[0] == dpid]:
+            del self.port_interval[key]
+            self.port_due.pop(key, None)
+
+    def due(self, now):
+        # Return the (dpid, port_no) requests to send now and reschedule them;
+        # port_no is ALL_PORTS for a full switch poll
+        requests = []
+        while self.heap and self.heap[0][0] <= now:
+            due, _, dpid, port_no = heapq.heappop(self.heap)
+            if dpid not in self.datapaths:
+                continue
+            if port_no is ALL_PORTS:
+                interval = self.max_interval
+            else:
+                interval = self.port_interval.get((dpid, port_no))
+                if interval is None or self.port_due.get((dpid, port_no)) != due:
+                    # The port is back to normal (the full poll covers it) or
+                    # the entry was superseded by an earlier one
+                    continue
+            backoff = self.backoff[dpid]
+            sent, sent_interval = self.outstanding.get(dpid, (None, None))
+            if sent is not None and now - sent > sent_interval * backoff:
+                # The previous request is still unanswered after its own
+                # interval: give it up as lost (the next slot sends again)
+                # and slow the switch down
+                self.backoff[dpid] = backoff = min(self.max_backoff, backoff * 2)
+                del self.outstanding[dpid]
+                if self.logger is not None:
+                    self.logger.warning('Stats request to switch %s unanswered for %.1f s, '
+                                        'backoff %s', dpid, now - sent, backoff)
+            else:
+                requests.append((dpid, port_no))
+                if self.port_stats:
+                    self.outstanding.setdefault(dpid, (now, interval))
+            due = now + self._spread(interval * backoff)
+            if port_no is not ALL_PORTS:
+                self.port_due[(dpid, port_no)] = due
+            self._push(due, dpid, port_no)
+        return requests
+
+    def next_due(self, now):
+        # Seconds until the next scheduled request
+        if not self.heap:
+            return self.min_interval
+        return max(0.0, self.heap[0][0] - now)
+
+    def reply_received(self, dpid, now):
+        sent, _ = self.outstanding.pop(dpid, (None, None))
+        if sent is None or dpid not in self.backoff:
+            return
+        if now - sent > self.slow_reply:
+            self.backoff[dpid] = min(self.max_backoff, self.backoff[dpid] * 2)
+        elif self.backoff[dpid] > 1:
+            self.backoff[dpid] = max(1, self.backoff[dpid] / 2)
+
+    def request_failed(self, dpid):
+        # The switch answered a request with an error: nothing is outstanding
+        self.outstanding.pop(dpid, None)
+
+    def update_port(self, dpid, port_no, load, blocked, now):
+        # Adapt the polling interval of a port to its load (throughput divided
+        # by threshold) after each sample
+        if not self.port_stats:
+            return
+        key = (dpid, port_no)
+        if not blocked and load < self.near_ratio:
+            self.port_interval.pop(key, None)
+            self.port_due.pop(key, None)
+            return
+        if blocked or load >= 1:
+            interval = self.min_interval
+        else:
+            # Linear from max_interval at near_ratio to min_interval at 1
+            fraction = (load - self.near_ratio) / (1 - self.near_ratio)
+            interval = self.max_interval - (self.max_interval - self.min_interval) * fraction
+        self.port_interval[key] = interval
+        if dpid not in self.datapaths:
+            return
+        # Bring the next poll of the port forward if the new interval is shorter
+        due = now + self._spread(interval)
+        if key not in self.port_due or due < self.port_due[key]:
+            self.port_due[key] = due
+            self._push(due, dpid, port_no)
@@ -0,0 +1,95 @@
+import collections
+import queue
+import threading
+
+
+class StatsWorker(object):
+    # Port stats analysis off the ryu event loop.
+    #
+    # The reply handler only submits a snapshot of the counters of a reply
+    # (dpid first, then whatever evaluate takes; submit_to evaluates it with
+    # another function, e.g. for rates pushed by the sFlow collector). An OS
+    # thread takes the snapshots in batches of up to `batch` replies and runs
+    # evaluate(*snapshot) on each, which computes the rates and runs the
+    # detectors and returns a list of decisions; the decisions are passed to
+    # apply(*decision) back on the event loop by the green thread of
+    # dispatch_loop, every poll_interval seconds. ryu does not
+    # patch threading, so the worker is a real thread: the rate and
+    # detector math (numpy releases the GIL) overlaps the packet-in
+    # handling instead of delaying it.
+    #
+    # The state used by evaluate belongs to the worker: the event loop never
+    # touches it, nor waits for the worker, but queues functions reading or
+    # changing it with call, run by the worker in order with the snapshots
+    # and their results handed back like the decisions. With threaded False
+    # the snapshot is evaluated and applied in the handler (replay harness).
+
+    def __init__(self, evaluate, apply, threaded=True, batch=64, poll_interval=0.05, logger=None):
+        self.evaluate = evaluate
+        self.apply = apply
+        self.threaded = threaded
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.pending = queue.Queue()  # (evaluate, snapshot, apply) not evaluated yet
+        self.decisions = collections.deque()  # (apply, decision) evaluated, not applied yet
+        self.thread = None
+
+    def submit(self, *snapshot):
+        self.submit_to(self.evaluate, *snapshot)
+
+    def submit_to(self, evaluate, *snapshot):
+        self._put(evaluate, snapshot, self.apply)
+
+    def call(self, function, *args, then=None):
+        # Run function(*args) on the worker; then(result), if given, runs
+        # on the event loop
+        def evaluate(*args):
+            result = function(*args)
+            return [(result,)] if then is not None else []
+        self._put(evaluate, args, then)
+
+    def _put(self, evaluate, snapshot, apply):
+        if not self.threaded:
+            for decision in evaluate(*snapshot):
+                apply(*decision)
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='stats-worker')
+            self.thread.daemon = True
+            self.thread.start()
+        self.pending.put((evaluate, snapshot, apply))
+
+    def backlog(self):
+        # Replies waiting for the worker
+        return self.pending.qsize()
+
+    def _run(self):
+        while True:
+            jobs = [self.pending.get()]
+            while len(jobs) < self.batch:
+                try:
+                    jobs.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            for evaluate, snapshot, apply in jobs:
+                try:
+                    decisions = evaluate(*snapshot)
+                except Exception:
+                    if self.logger is not None:
+                        self.logger.exception('Port stats evaluation %s%r failed', evaluate.__name__, snapshot[:1])
+                    continue
+                self.decisions.extend((apply, decision) for decision in decisions)
+
+    def dispatch_loop(self, sleep):
+        # Green thread applying the decisions; sleep is hub.sleep
+        while True:
+            decisions = self.decisions
+            while decisions:
+                apply, decision = decisions.popleft()
+                try:
+                    apply(*decision)
+                except Exception:
+                    if self.logger is not None:
+                        self.logger.exception('Applying the port stats decision %s failed', decision)
+            sleep(self.poll_interval)
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class SwitchHistory(object):
+    # Throughput history of all the ports of one switch: one preallocated
+    # (ports x window) float64 ring buffer, plus running sums of the samples
+    # and of their squares so that mean and standard deviation of every port
+    # are available in O(1) instead of being recomputed over the window.
+    __slots__ = ('window', 'port_index', 'samples', 'pos', 'count', 'total', 'total_sq')
+
+    def __init__(self, window, capacity):
+        self.window = window
+        self.port_index = {}  # port_no -> row of the arrays
+        self.samples = np.zeros((capacity, window), dtype=np.float64)
+        self.pos = np.zeros(capacity, dtype=np.int64)  # next column to write, per port
+        self.count = np.zeros(capacity, dtype=np.int64)  # number of valid samples, per port
+        self.total = np.zeros(capacity, dtype=np.float64)
+        self.total_sq = np.zeros(capacity, dtype=np.float64)
+
+    def _grow(self, capacity):
+        extra = capacity - len(self.count)
+        self.samples = np.vstack((self.samples, np.zeros((extra, self.window), dtype=np.float64)))
+        self.pos = np.concatenate((self.pos, np.zeros(extra, dtype=np.int64)))
+        self.count = np.concatenate((self.count, np.zeros(extra, dtype=np.int64)))
+        self.total = np.concatenate((self.total, np.zeros(extra, dtype=np.float64)))
+        self.total_sq = np.concatenate((self.total_sq, np.zeros(extra, dtype=np.float64)))
+
+    def rows(self, port_nos):
+        # Rows of the given ports, allocating new rows for unseen ports
+        port_index = self.port_index
+        for port_no in port_nos:
+            if port_no not in port_index:
+                if len(port_index) == len(self.count):
+                    self._grow(2 * len(self.count))
+                port_index[port_no] = len(port_index)
+        return np.fromiter((port_index[port_no] for port_no in port_nos),
+                           dtype=np.int64, count=len(port_nos))
+
+    def add(self, rows, values):
+        # Append one sample per row, replacing the oldest one of full rows
+        pos = self.pos[rows]
+        old = np.where(self.count[rows] >= self.window, self.samples[rows, pos], 0.0)
+        self.samples[rows, pos] = values
+        self.total[rows] += values - old
+        self.total_sq[rows] += values * values - old * old
+        self.count[rows] = np.minimum(self.count[rows] + 1, self.window)
+        pos = (pos + 1) % self.window
+        self.pos[rows] = pos
+
+        # Recompute the sums exactly once per window to stop the floating
+        # point error of the running updates from accumulating
+        wrapped = rows[pos == 0]
+        if len(wrapped):
+            self.total[wrapped] = self.samples[wrapped].sum(axis=1)
+            self.total_sq[wrapped] = np.square(self.samples[wrapped]).sum(axis=1)
+
+    def series(self, port_no):
+        # Samples of the port in the window, oldest first
+        row = self.port_index[port_no]
+        count = self.count[row]
+        order = (np.arange(self.pos[row] - count, self.pos[row])) % self.window
+        return self.samples[row, order].tolist()
+
+    def thresholds(self, rows, k):
+        # mean + k * sample standard deviation of each row, and the number of
+        # samples it is computed on
+        count = self.count[rows]
+        n = np.maximum(count, 1)
+        mean = self.total[rows] / n
+        var = (self.total_sq[rows] - n * mean * mean) / np.maximum(n - 1, 1)
+        return mean + k * np.sqrt(np.maximum(var, 0.0)), count
+
+
+class ThroughputStore(object):
+    # Per-switch throughput histories with vectorized dynamic thresholds
+
+    def __init__(self, window=100, capacity=8):
+        self.window = window  # number of samples kept per port
+        self.capacity = capacity  # initial number of ports per switch
+        self.switches = {}
+
+    def update(self, dpid, port_nos, values, k=2):
+        # Add one throughput sample for each of the given ports and return,
+        # for every port, the threshold mean + k * stddev over its window and
+        # the number of samples in the window
+        history = self.switches.get(dpid)
+        if history is None:
+            history = self.switches[dpid] = SwitchHistory(self.window, self.capacity)
+        rows = history.rows(port_nos)
+        history.add(rows, np.asarray(values, dtype=np.float64))
+        return history.thresholds(rows, k)
+
+    def history(self):
+        # {(dpid, port_no): samples oldest first} of every port, for snapshots
+        return dict(((dpid, port_no), history.series(port_no))
+                    for dpid, history in self.switches.items() for port_no in history.port_index)
+
+    def restore(self, dpid, port_no, samples):
+        # Refill the window of a port from a snapshot
+        history = self.switches.get(dpid)
+        if history is None:
+            history = self.switches[dpid] = SwitchHistory(self.window, self.capacity)
+        rows = history.rows([port_no])
+        for value in samples[-self.window:]:
+            history.add(rows, np.asarray([value], dtype=np.float64))
+
+    def forget_datapath(self, dpid):
+        self.switches.pop(dpid, None)
@@ -0,0 +1,128 @@
+import collections
+
+# Direction of the traffic exceeding the threshold of a port
+RX = 'rx'  # received on the port
+TX = 'tx'  # transmitted on the port
+
+# First reserved port number (OFPP_MAX of OpenFlow 1.3): OFPP_LOCAL and the
+# other reserved ports are not edge ports
+OFPP_MAX = 0xffffff00
+
+
+class TopologyGraph(object):
+    # Switch graph of the network, telling host-facing edge ports from the
+    # inter-switch links. Links come from the link bandwidth file exported by
+    # the topology scripts (load_ports, entries whose peer is a switch) and
+    # from ryu's LLDP discovery (link_added/link_deleted, see
+    # lldp_firewall.py). Every port that is not on a link is an edge port, so
+    # without any link all ports are edge ports.
+    #
+    # A flood crosses every switch on its path: it is received on the edge
+    # port of the attacker and on the trunk ports downstream, and sent on the
+    # trunk ports and the edge port of the victim. ingress_ports gives the
+    # edge ports the traffic exceeding a port can have entered from, so that
+    # only the ingress edge port is mitigated.
+
+    def __init__(self):
+        self.file_links = {}  # (dpid, port_no) -> (peer dpid, peer port_no)
+        self.lldp_links = {}
+        self.peers = {}  # union of both
+        self.file_edge = {}  # dpid -> edge ports of the link bandwidth file
+        self.seen_edge = collections.defaultdict(set)  # dpid -> edge ports of the statistics
+        self.edge = {}  # dpid -> edge ports, union of both without the link ports
+        self.neighbours = {}  # dpid -> {port_no: peer dpid}
+
+    def load_ports(self, entries):
+        # Links of the "ports" entries of the link bandwidth file: a port
+        # whose peer is a switch is paired with the port of that switch
+        # facing back (in order, for parallel links)
+        dpids = {}
+        for entry in entries:
+            dpids[entry['switch']] = int(entry['dpid'])
+        facing = collections.defaultdict(list)
+        edge = collections.defaultdict(set)
+        for entry in entries:
+            if entry['peer'] in dpids:
+                facing[(entry['switch'], entry['peer'])].append(int(entry['port']))
+            else:
+                edge[int(entry['dpid'])].add(int(entry['port']))
+        self.file_edge = dict(edge)
+        links = {}
+        for (switch, peer), ports in facing.items():
+            for port_no, peer_port in zip(ports, facing.get((peer, switch), [])):
+                links[(dpids[switch], port_no)] = (dpids[peer], peer_port)
+        self.file_links = links
+        self._rebuild()
+
+    def link_added(self, src_dpid, src_port, dst_dpid, dst_port):
+        # LLDP reports each direction of a link separately
+        self.lldp_links[(src_dpid, src_port)] = (dst_dpid, dst_port)
+        self._rebuild()
+
+    def link_deleted(self, src_dpid, src_port):
+        if self.lldp_links.pop((src_dpid, src_port), None) is not None:
+            self._rebuild()
+
+    def forget_datapath(self, dpid):
+        for key in [key for key, peer in self.lldp_links.items() if dpid in (key[0], peer[0])]:
+            del self.lldp_links[key]
+        self.seen_edge.pop(dpid, None)
+        self._rebuild()
+
+    def _rebuild(self):
+        peers = dict(self.file_links)
+        peers.update(self.lldp_links)
+        neighbours = collections.defaultdict(dict)
+        for (dpid, port_no), (peer_dpid, _) in peers.items():
+            neighbours[dpid][port_no] = peer_dpid
+        self.peers = peers
+        self.neighbours = dict(neighbours)
+        edge = collections.defaultdict(set)
+        for table in (self.file_edge, self.seen_edge):
+            for dpid, ports in table.items():
+                edge[dpid].update(port_no for port_no in ports if (dpid, port_no) not in peers)
+        self.edge = dict(edge)
+
+    def is_edge(self, dpid, port_no):
+        return (dpid, port_no) not in self.peers
+
+    def port_seen(self, dpid, port_no):
+        # Edge ports are also learned from the statistics replies: ports
+        # neither reserved nor on a known link (the links learned later are
+        # left out by _rebuild)
+        if port_no >= OFPP_MAX or (dpid, port_no) in self.peers or port_no in self.seen_edge.get(dpid, ()):
+            return
+        self.seen_edge[dpid].add(port_no)
+        self.edge.setdefault(dpid, set()).add(port_no)
+
+    def _component(self, start, cut):
+        # Switches reachable from start without crossing the link of the
+        # port `cut` (dpid, port_no) in either direction
+        cut_peer = self.peers.get(cut)
+        seen = set([start])
+        stack = [start]
+        while stack:
+            dpid = stack.pop()
+            for port_no, peer_dpid in self.neighbours.get(dpid, {}).items():
+                if (dpid, port_no) == cut or (dpid, port_no) == cut_peer:
+                    continue
+                if peer_dpid not in seen:
+                    seen.add(peer_dpid)
+                    stack.append(peer_dpid)
+        return seen
+
+    def ingress_ports(self, dpid, port_no, direction):
+        # Edge ports upstream of the traffic exceeding the port in the given
+        # direction; the port itself when it receives the traffic from a host
+        key = (dpid, port_no)
+        if direction == RX:
+            peer = self.peers.get(key)
+            if peer is None:
+                return set([key])
+            # Received from the peer switch: it entered on its side of the link
+            switches = self._component(peer[0], key)
+        else:
+            # Sent on the port: it entered on another port of the switch
+            switches = self._component(dpid, key)
+        return set((switch, edge_port) for switch in switches for edge_port in self.edge.get(switch, ())
+                   if (switch, edge_port) != key and (switch, edge_port) not in self.peers)